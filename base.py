@@ -1,20 +1,31 @@
+import asyncio
+
 import flet as ft
-from dbutils import JudoShiaiConnector_WEB
+from cache import TTLCache
+from dbutils import AsyncJudoShiaiConnector
 
 
 class MatchApp:
     def __init__(self, page: ft.Page, host="localhost"):
 
         # DB connector
-        self.jsc = JudoShiaiConnector_WEB(host)
+        self.jsc = AsyncJudoShiaiConnector(host)
 
         # init
         self.page = page
         self.page.title = "JudoShiai Match Result GUI"
 
         # cache
-        self.matches = {}
-        self.competitors = {}
+        # match results change all the time, competitors rarely after weigh-in
+        self.matches = TTLCache(maxsize=200, ttl=15)  # category id -> bundle
+        self.competitors = TTLCache(maxsize=5000, ttl=3600)  # competitor id -> info
+
+        # category overview, kept between visits and patched incrementally
+        self.overview_view = None
+        self.overview_tiles = {}  # category id -> (category row, tile)
+        self.overview_polling = False
+        self.overview_poll_interval = 10  # seconds
+        self.closed = False  # set on disconnect, stops background tasks
 
         # layout and style
         self.page.theme_mode = ft.ThemeMode.LIGHT
@@ -24,6 +35,9 @@ class MatchApp:
         self.page.on_route_change = self.route_change
         self.page.on_view_pop = self.view_pop
 
+        # release pooled connections when the client goes away
+        self.page.on_disconnect = self.close
+
         # define reusable app bar
         self.appbar_items = [
             ft.PopupMenuItem(text="Main", on_click=self.open_home),
@@ -48,17 +62,17 @@ class MatchApp:
         self.page.appbar = self.appbar
         self.page.update()
 
-    def route_change(self, e):
+    async def route_change(self, e):
         troute = ft.TemplateRoute(self.page.route)
 
         self.page.views.clear()
 
         if troute.match("/"):
-            self.set_overview_view()
+            await self.set_overview_view()
 
         elif troute.match("/category/:id"):
             qid = troute.id
-            self.set_category_view(qid)
+            await self.set_category_view(qid)
 
         elif troute.match("/about"):
             self.set_about_view()
@@ -67,47 +81,101 @@ class MatchApp:
             self.set_settings_view()
 
         else:
-            print("Unknown Path: ", e.route)
+            print("Unknown Path: ", self.page.route)
 
         self.page.update()
 
-    def set_overview_view(self):
+    async def set_overview_view(self):
         self.solution_found = []
 
-        categories = self.jsc.get_categories()
+        if self.overview_view is None:
+            # show the (empty) view while waiting for JudoShiai
+            self.overview_view = self.loading_view("/")
+            self.overview_view.horizontal_alignment = ft.CrossAxisAlignment.CENTER
+            self.page.views.append(self.overview_view)
+            self.page.update()
+        else:
+            # reuse existing tiles, only patch what changed since last visit
+            self.page.views.append(self.overview_view)
+
+        await self.sync_overview()
+
+        if not self.overview_polling:
+            self.overview_polling = True
+            self.page.run_task(self.poll_overview)
 
-        columns = []
+    async def sync_overview(self):
+        # diff the category rows against the rows behind the tiles
+        categories = [tuple(cat) for cat in await self.jsc.get_categories()]
+        if categories == [tile[0] for tile in self.overview_tiles.values()]:
+            return
 
-        for cat in categories:
-            is_finished = self.check_status(cat)
-            color = ft.Colors.LIGHT_BLUE_100 if is_finished else ft.Colors.WHITE
-            item = ft.Container(
-                content=ft.Text(cat[1], size=30),
-                col={"sm": 6, "md": 4, "xl": 2},
-                on_click=self.open_category(cat[0]),
-                margin=10,
-                padding=10,
-                alignment=ft.alignment.center,
-                bgcolor=color,
-                width=200,
-                height=80,
-                border_radius=10,
-            )
+        tile_ids = [cat[0] for cat in categories]
+        tile_names = [cat[1] for cat in categories]
+        known_ids = list(self.overview_tiles.keys())
+        known_names = [tile[0][1] for tile in self.overview_tiles.values()]
 
-            columns.append(item)
+        if tile_ids != known_ids or tile_names != known_names:
+            # categories were added/removed/renamed -> rebuild all tiles
+            self.overview_tiles = {}
+            for cat in categories:
+                self.overview_tiles[cat[0]] = (cat, self.category_tile(cat))
 
-        # create rows
-        resprows = ft.ResponsiveRow(columns)
+            columns = [tile for _, tile in self.overview_tiles.values()]
+            self.overview_view.controls = [self.appbar, ft.ResponsiveRow(columns)]
 
-        view_elements = [self.appbar, resprows]
+        else:
+            # same tiles, only recolor the changed ones
+            for cat in categories:
+                old_cat, tile = self.overview_tiles[cat[0]]
+                if old_cat != cat:
+                    tile.bgcolor = self.category_color(cat)
+                    self.overview_tiles[cat[0]] = (cat, tile)
+
+        self.page.update()
 
+    async def poll_overview(self):
+        # keep the overview up to date while it is shown
+        try:
+            while not self.closed and self.page.route == "/":
+                await asyncio.sleep(self.overview_poll_interval)
+                if self.closed or self.page.route != "/":
+                    break
+                try:
+                    await self.sync_overview()
+                except Exception as e:
+                    # e.g. JudoShiai not reachable, try again next round
+                    print(f"Could not refresh the category overview: {e}")
+        finally:
+            self.overview_polling = False
+
+    def category_tile(self, cat):
+        item = ft.Container(
+            content=ft.Text(cat[1], size=30),
+            col={"sm": 6, "md": 4, "xl": 2},
+            on_click=self.open_category(cat[0]),
+            margin=10,
+            padding=10,
+            alignment=ft.alignment.center,
+            bgcolor=self.category_color(cat),
+            width=200,
+            height=80,
+            border_radius=10,
+        )
+        return item
+
+    def category_color(self, cat):
+        is_finished = self.check_status(cat)
+        color = ft.Colors.LIGHT_BLUE_100 if is_finished else ft.Colors.WHITE
+        return color
+
+    def loading_view(self, route):
         view = ft.View(
-            "/",
-            view_elements,
-            horizontal_alignment=ft.CrossAxisAlignment.CENTER,
+            route,
+            [self.appbar, ft.ProgressRing()],
             scroll=ft.ScrollMode.AUTO,
         )
-        self.page.views.append(view)
+        return view
 
     def check_status(self, cat):
         numcomp = int(cat[2])
@@ -120,14 +188,22 @@ class MatchApp:
 
         return is_finished
 
-    def set_category_view(self, cid):
+    async def set_category_view(self, cid):
+
+        view = self.loading_view(f"/category/{cid}")
+        self.page.views.append(view)
+        self.page.update()
 
-        matches = self.jsc.get_matches(cid)
-        cat_info = self.jsc.get_category_info(cid)
+        bundle = self.matches.get(str(cid))
+        if bundle is None:
+            bundle = await self.jsc.get_category_bundle(cid)
+            self.store_category_bundle(cid, bundle)
+        matches = bundle["matches"]
+        cat_info = bundle["category"]
         rows = []
 
         for match in matches:
-            mi = self.match_item(match)
+            mi = await self.match_item(match)
             rows.append(mi)
 
         back_button = ft.ElevatedButton(
@@ -138,18 +214,32 @@ class MatchApp:
             text="CLEAR ALL MATCHES", icon=ft.Icons.WARNING, on_click=self.reset_matches(matches), color=ft.Colors.RED
         )
 
-        view = ft.View(
-            f"/category/{cid}",
-            [
-                self.appbar,
-                back_button,
-                ft.Text(cat_info[0], size=40),
-                *rows,
-                ft.Row([back_button, reset_matches_button], alignment=ft.MainAxisAlignment.SPACE_BETWEEN),
-            ],
-            scroll=ft.ScrollMode.AUTO,
-        )
-        self.page.views.append(view)
+        view.controls = [
+            self.appbar,
+            back_button,
+            ft.Text(cat_info[0], size=40),
+            *rows,
+            ft.Row([back_button, reset_matches_button], alignment=ft.MainAxisAlignment.SPACE_BETWEEN),
+        ]
+
+    def store_category_bundle(self, cid, bundle):
+        # fill the caches from a single bulk query, so that `match_item`
+        # does not need to ask the DB for every single match
+        for competitor_id, info in bundle["competitors"].items():
+            self.competitors.set(competitor_id, info)
+
+        cat_bundle = {
+            "category": bundle["category"],
+            "matches": bundle["matches"],
+            "match_infos": bundle["match_infos"],
+        }
+        self.matches.set(str(cid), cat_bundle)
+
+    def invalidate_category(self, cid):
+        self.matches.invalidate(str(cid))
+
+    def invalidate_competitor(self, competitor_id):
+        self.competitors.invalidate(str(competitor_id))
 
     def set_about_view(self):
         view = ft.View(
@@ -173,20 +263,74 @@ class MatchApp:
             on_click=self.reset_cache,
             icon=ft.Icons.RESTART_ALT,
         )
-        view_elements = [self.appbar, button_reset]
+        cache_stats = [
+            ft.Text(f"{name}: {cache.stats()}")
+            for name, cache in [("Matches", self.matches), ("Competitors", self.competitors)]
+        ]
+        view_elements = [self.appbar, button_reset, *cache_stats]
         view = ft.View("/settings", view_elements)
         self.page.views.append(view)
 
     def reset_matches(self, matches):
 
-        def reset_cat_matches(e):
-            for m in matches:
-                category_id = m[0]
-                match_id = m[1]
-                self.reset_points(category_id, match_id)
+        async def reset_cat_matches(e):
+            if not matches:
+                return
+
+            # send everything at once, track ACKs as they arrive
+            progress = ft.ProgressBar(value=0.0)
+            progress_text = ft.Text(f"Clearing 0 / {len(matches)} matches")
+            self.page.open(ft.SnackBar(ft.Column([progress_text, progress]), duration=60000))
+
+            futures = await self.jsc.reset_match_results(matches)
+            match_ids = {future: m[1] for m, future in zip(matches, futures)}
+
+            # the channel fails unacknowledged messages after its timeout, the
+            # margin covers the expiry polling and a reconnect
+            loop = asyncio.get_running_loop()
+            deadline = loop.time() + self.jsc.jsc.channel.timeout + 5
+
+            failed = []
+            pending = set(futures)
+            while pending:
+                remaining = deadline - loop.time()
+                if remaining <= 0:
+                    break
+                done, pending = await asyncio.wait(
+                    pending, timeout=remaining, return_when=asyncio.FIRST_COMPLETED
+                )
+                for future in done:
+                    if future.cancelled() or future.exception() is not None:
+                        failed.append(match_ids[future])
+
+                n_done = len(matches) - len(pending)
+                progress.value = n_done / len(matches)
+                progress_text.value = f"Clearing {n_done} / {len(matches)} matches"
+                self.page.update()
+
+            # still no answer at the deadline -> count as failed
+            for future in pending:
+                future.cancel()
+                failed.append(match_ids[future])
+
+            await self.show_reset_summary(matches, failed)
 
         return reset_cat_matches
 
+    async def show_reset_summary(self, matches, failed):
+        if failed:
+            failed_text = ", ".join([str(mid) for mid in sorted(failed, key=int)])
+            text = f"Could not clear {len(failed)} of {len(matches)} matches: {failed_text}"
+            color = ft.Colors.RED_700
+        else:
+            text = f"Cleared all {len(matches)} matches"
+            color = ft.Colors.GREEN_700
+
+        # redraw view, so that the radio buttons show the cleared state
+        for cid in set([m[0] for m in matches]):
+            self.invalidate_category(cid)
+        await self.route_change(None)
+        self.page.open(ft.SnackBar(ft.Text(text), bgcolor=color))
 
     def view_pop(self, e):
         print("View pop:", e.view)
@@ -213,45 +357,52 @@ class MatchApp:
         e.control.bgcolor = ft.Colors.LIGHT_BLUE_50 if e.data == "true" else ""
         e.control.update()
 
-    def refresh_match_item(self, match):
+    async def refresh_match_item(self, match):
         cat_id = match[0]
         match_number = match[1]
 
         # retrieve match informations
-        match_info = self.jsc.get_match_info(cat_id, match_number)
-        if cat_id in self.matches.keys():
-            self.matches[cat_id][match_number] = match_info
-        else:
-            self.matches[cat_id] = {match_number: match_info}
-
-        # update info about competitor blue
-        blue_info = self.jsc.get_competitor_info(match_info[0])
-        self.competitors[match_info[0]] = blue_info
-
-        # update info about competitor white
-        white_info = self.jsc.get_competitor_info(match_info[1])
-        self.competitors[match_info[1]] = white_info
+        match_info = await self.jsc.get_match_info(cat_id, match_number)
+        cat_bundle = self.matches.get(str(cat_id))
+        if cat_bundle is not None:
+            cat_bundle["match_infos"][match_number] = match_info
+
+        # update info about both competitors (concurrently)
+        blue_info, white_info = await asyncio.gather(
+            self.jsc.get_competitor_info(match_info[0]),
+            self.jsc.get_competitor_info(match_info[1]),
+        )
+        self.competitors.set(str(match_info[0]), blue_info)
+        self.competitors.set(str(match_info[1]), white_info)
 
         return match_info, blue_info, white_info
 
-    def match_item(self, match):
+    async def match_item(self, match):
 
         cat_id = match[0]
         match_number = match[1]
 
-        if (
-            cat_id in self.matches.keys()
-            and match_number in self.matches[cat_id].keys()
-        ):
-            match_info = self.matches[cat_id][match_number]
-            blue_info = self.competitors[match_info[0]]
-            white_info = self.competitors[match_info[1]]
-        else:
-            match_info, blue_info, white_info = self.refresh_match_item(match)
+        cat_bundle = self.matches.get(str(cat_id), {"match_infos": {}})
+        match_info = cat_bundle["match_infos"].get(match_number)
+        if match_info is not None:
+            blue_info = self.competitors.get(str(match_info[0]))
+            white_info = self.competitors.get(str(match_info[1]))
+
+        if match_info is None or blue_info is None or white_info is None:
+            match_info, blue_info, white_info = await self.refresh_match_item(match)
+
+        # competitors currently shown for this match
+        shown_competitors = [match_info[0], match_info[1]]
+
+        async def refresh_callback(e):
+            # forget the shown competitors first, nothing outdated is served
+            # from the cache even if the refresh fails
+            for competitor_id in shown_competitors:
+                self.invalidate_competitor(competitor_id)
 
-        def refresh_callback(e):
             # this is a bit quick'n'dirty, but at least it works :-)
-            match_info, blue_info, white_info = self.refresh_match_item(match)
+            match_info, blue_info, white_info = await self.refresh_match_item(match)
+            shown_competitors[:] = [match_info[0], match_info[1]]
 
             blue_box.content.controls[0].value = f"{blue_info[1]} {blue_info[0]}"
             blue_box.content.controls[1].value = f"({blue_info[2]})"
@@ -375,25 +526,36 @@ class MatchApp:
             return 0x00000
 
     def update_points(self, category_id, match_id, is_blue):
-        def update_db_points(e):
+        async def update_db_points(e):
             winner_score = e.control.value
             if is_blue:
-                self.jsc.set_match_result(
-                    category_id, match_id, blue_score=winner_score, white_score=0x0
-                )
+                blue_score, white_score = winner_score, 0x0
             else:
-                self.jsc.set_match_result(
-                    category_id, match_id, blue_score=0x0, white_score=winner_score
+                blue_score, white_score = 0x0, winner_score
+
+            # stored result is outdated in any case
+            self.invalidate_category(category_id)
+
+            try:
+                await self.jsc.set_match_result(
+                    category_id, match_id, blue_score=blue_score, white_score=white_score
                 )
-            # e.page.update()
+                text = f"Match {match_id}: result saved"
+                color = ft.Colors.GREEN_700
+            except Exception as ex:
+                text = f"Match {match_id}: result NOT saved ({ex!r})"
+                color = ft.Colors.RED_700
+
+            self.page.open(ft.SnackBar(ft.Text(text), bgcolor=color))
 
         return update_db_points
 
-    def reset_points(self, category_id, match_id):
-        self.jsc.set_match_result(
-            category_id, match_id, blue_score=0x0, white_score=0x0
-        )
+    async def close(self, e=None):
+        self.closed = True
+        await self.jsc.close()
 
     def reset_cache(self, e):
-        self.matches = {}
-        self.competitors = {}
+        self.matches.clear()
+        self.competitors.clear()
+        self.overview_view = None
+        self.overview_tiles = {}
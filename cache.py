@@ -0,0 +1,71 @@
+import time
+from collections import OrderedDict
+
+
+# small in-memory cache with per-entry time-to-live and LRU size bound
+class TTLCache:
+
+    def __init__(self, maxsize=1000, ttl=60.0, timer=time.monotonic):
+        self.maxsize = maxsize
+        self.ttl = ttl  # seconds
+        self.timer = timer
+
+        # key -> (expiry time, value), oldest usage first
+        self.entries = OrderedDict()
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __contains__(self, key):
+        return self._lookup(key) is not None
+
+    def get(self, key, default=None):
+        entry = self._lookup(key)
+
+        if entry is None:
+            self.misses += 1
+            return default
+
+        self.hits += 1
+        self.entries.move_to_end(key)
+        return entry[1]
+
+    def set(self, key, value, ttl=None):
+        ttl = self.ttl if ttl is None else ttl
+        self.entries[key] = (self.timer() + ttl, value)
+        self.entries.move_to_end(key)
+
+        # evict least recently used entries
+        while len(self.entries) > self.maxsize:
+            self.entries.popitem(last=False)
+            self.evictions += 1
+
+    def invalidate(self, key):
+        self.entries.pop(key, None)
+
+    def clear(self):
+        self.entries.clear()
+
+    def stats(self):
+        stats = {
+            "size": len(self.entries),
+            "maxsize": self.maxsize,
+            "ttl": self.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+        }
+        return stats
+
+    def _lookup(self, key):
+        entry = self.entries.get(key)
+
+        if entry is not None and entry[0] <= self.timer():
+            del self.entries[key]
+            entry = None
+
+        return entry
@@ -1,48 +1,189 @@
 import sqlite3 as sql
+import abc
+import asyncio
+import collections
+import contextlib
+import threading
+import time
 import requests
 import json
 import websocket
+from concurrent.futures import Future
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+import queries
+
+
+# queries shared by both connectors, see `queries` for the SQL
+# connectors only need to implement `select_cmd`
+class JudoShiaiQueries(abc.ABC):
+
+    # competitor ids with special meaning in a match
+    placeholder_competitors = {
+        "0": ["unknown", "", "", "", ""],
+        "1": ["empty", "", "", "", ""],
+    }
+
+    @abc.abstractmethod
+    def select_cmd(self, cmd, params=None):
+        # run `cmd` with named parameters `params`, returns list of rows
+        pass
+
+    def get_category_definitions(self):
+        return self.select_cmd(queries.CATEGORY_DEFINITIONS)
+
+    def get_categories(self):
+        return self.select_cmd(queries.CATEGORIES)
+
+    def get_category_info(self, cid):
+        return self.select_cmd(queries.CATEGORY_INFO, {"cid": int(cid)})[0]
+
+    def get_match_info(self, cid, mid):
+        params = {"cid": int(cid), "mid": int(mid)}
+        return self.select_cmd(queries.MATCH_INFO, params)[0]
+
+    def get_next_category_index(self):
+        # first free index for a new category
+        max_index = self.select_cmd(queries.MAX_CATEGORY_INDEX)[0][0]
+        return 10001 if max_index is None else int(max_index) + 1
+
+    def get_competitors_of_category(self, cat_label):
+        return self.select_cmd(queries.COMPETITORS_OF_CATEGORY, {"category": cat_label})
+
+    def get_competitors_of_categories(self, cat_labels):
+        # category label -> competitors, for many categories in one query
+        cat_labels = list(cat_labels)
+        competitors = {cat_label: [] for cat_label in cat_labels}
+        if not cat_labels:
+            return competitors
+
+        cmd = queries.competitors_of_categories_cmd(len(cat_labels))
+        params = {f"category{i}": cat_label for i, cat_label in enumerate(cat_labels)}
+        for row in self.select_cmd(cmd, params):
+            competitors[row[5]].append(list(row))
+        return competitors
+
+    def get_competitor_info(self, cid):
+        if str(cid) in self.placeholder_competitors.keys():
+            return self.placeholder_competitors[str(cid)]
+        else:
+            return self.select_cmd(queries.COMPETITOR_INFO, {"cid": int(cid)})[0]
+
+    def get_matches(self, category_id):
+        return self.select_cmd(queries.MATCHES, {"cid": int(category_id)})
+
+    def get_category_bundle(self, cid):
+        # everything needed to display a category, in two queries instead of
+        # one query per match and competitor
+        params = {"cid": int(cid)}
+        rows = self.select_cmd(queries.CATEGORY_BUNDLE_MATCHES, params)
+        competitor_rows = self.select_cmd(queries.CATEGORY_BUNDLE_COMPETITORS, params)
+        return self.build_category_bundle(rows, competitor_rows)
+
+    def build_category_bundle(self, rows, competitor_rows):
+        cat_info = rows[0][:6] if rows else []
+        matches = []
+        match_infos = {}
+        for row in rows:
+            if row[7] in (None, ""):
+                continue
+            matches.append([row[6], row[7], row[10], row[11]])
+            match_infos[row[7]] = [row[8], row[9], row[10], row[11]]
+
+        competitors = {str(c[0]): c[1:] for c in competitor_rows}
+        competitors.update(self.placeholder_competitors)
+
+        bundle = {
+            "category": cat_info,
+            "matches": matches,
+            "match_infos": match_infos,
+            "competitors": competitors,
+        }
+        return bundle
 
 
 # only use for offline use, recommended to use WEB-connector during runtime
-class JudoShiaiConnector_SQLITE:
+class JudoShiaiConnector_SQLITE(JudoShiaiQueries):
+
+    competitor_columns = queries.COMPETITOR_COLUMNS
 
-    def __init__(self, db_path="tournament.shi"):
+    def __init__(
+        self,
+        db_path="tournament.shi",
+        journal_mode=None,
+        synchronous=None,
+        cached_statements=256,
+    ):
         self.db_path = db_path
 
-    def select_cmd(self, cmd):
+        # one connection for the lifetime of the connector, sqlite3 keeps the
+        # prepared statements of the (constant) query strings in its cache
+        self.con = sql.connect(self.db_path, cached_statements=cached_statements)
+        self.transaction_depth = 0
+
+        # e.g. journal_mode="MEMORY", synchronous="OFF" for the offline build step
+        self.set_pragmas(journal_mode=journal_mode, synchronous=synchronous)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def close(self):
+        self.con.close()
+
+    def set_pragmas(self, journal_mode=None, synchronous=None):
+        if journal_mode is not None:
+            self.con.execute(f"PRAGMA journal_mode = {journal_mode} ;")
+        if synchronous is not None:
+            self.con.execute(f"PRAGMA synchronous = {synchronous} ;")
+
+    @contextlib.contextmanager
+    def transaction(self):
+        # group several statements into one commit (one fsync)
+        self.transaction_depth += 1
+        try:
+            yield self
+        except Exception:
+            self.transaction_depth -= 1
+            if self.transaction_depth == 0:
+                self.con.rollback()
+            raise
+        else:
+            self.transaction_depth -= 1
+            if self.transaction_depth == 0:
+                self.con.commit()
+
+    def select_cmd(self, cmd, params=None):
         # generic command to retrieve data from DB
-        con = sql.connect(self.db_path)
-        cur = con.cursor()
-        res = cur.execute(cmd)
+        res = self.con.execute(cmd, params or {})
         res_list = res.fetchall()
-        con.close()
 
         return res_list
 
-    def update_or_insert_cmd(self, cmd):
+    def update_or_insert_cmd(self, cmd, params=()):
         # generic command to update values in DB
-        con = sql.connect(self.db_path)
-        cur = con.cursor()
-        res = cur.execute(cmd)
-        con.commit()
-        con.close()
+        with self.transaction():
+            self.con.execute(cmd, params)
 
         return 0
 
-    def get_category_definitions(self):
-        cmd = """
-        SELECT agetext, weighttext
-        FROM "main"."catdef" ;
-        """
-        return self.select_cmd(cmd)
+    def update_or_insert_many_cmd(self, cmd, params_seq):
+        # same command for many rows, all within one transaction
+        with self.transaction():
+            self.con.executemany(cmd, params_seq)
+
+        return 0
 
     def insert_category(self, cat_name, ix=0):
-        cmd = f"""
-            INSERT INTO "main"."categories" ("index", "category", "tatami", "deleted", "group", "system", "numcomp", "table", "wishsys", "pos1", "pos2", "pos3", "pos4", "pos5", "pos6", "pos7", "pos8", "color") 
-            VALUES ('{ix}', '{cat_name}', '0', '0', '0', '0', '0', '0', '0', '0', '0', '0', '0', '0', '0', '0', '0', '');
-        """
-        return self.update_or_insert_cmd(cmd)
+        return self.insert_categories([(cat_name, ix)])
+
+    def insert_categories(self, categories):
+        # categories: iterable of (cat_name, ix)
+        params_seq = ({"index": ix, "category": cat_name} for cat_name, ix in categories)
+        return self.update_or_insert_many_cmd(queries.INSERT_CATEGORY, params_seq)
 
     def insert_competitor(
         self,
@@ -64,31 +205,196 @@ class JudoShiaiConnector_SQLITE:
         comment,
         coachid,
     ):
+        competitor = {
+            "index": index,
+            "last": last,
+            "first": first,
+            "birthyear": birthyear,
+            "belt": belt,
+            "club": club,
+            "regcategory": regcategory,
+            "weight": weight,
+            "visible": visible,
+            "category": category,
+            "deleted": deleted,
+            "country": country,
+            "id": id,
+            "seeding": seeding,
+            "clubseeding": clubseeding,
+            "comment": comment,
+            "coachid": coachid,
+        }
+        return self.insert_competitors([competitor])
+
+    def insert_competitors(self, competitors):
+        # competitors: iterable of dicts with keys as in `insert_competitor`
+        return self.update_or_insert_many_cmd(queries.INSERT_COMPETITOR, competitors)
+
+    def get_all_competitors(self):
+        # list of dicts with all columns of `competitor_columns`
+        rows = self.select_cmd(queries.ALL_COMPETITORS)
+        return [dict(zip(self.competitor_columns, row)) for row in rows]
+
+    def update_competitors(self, competitors, columns=None):
+        # competitors: iterable of dicts with keys as in `insert_competitor`
+        # columns: subset of columns to overwrite (default: all)
+        if columns is None:
+            cmd = queries.UPDATE_COMPETITOR
+        else:
+            cmd = queries.update_competitor_cmd(columns)
+        return self.update_or_insert_many_cmd(cmd, competitors)
+
+    def soft_delete_competitors(self, indices):
+        params_seq = ({"index": ix} for ix in indices)
+        return self.update_or_insert_many_cmd(queries.SOFT_DELETE_COMPETITOR, params_seq)
+
+    def apply_category_changes(self, new_categories=(), assignments=(), deleted_categories=()):
+        # all in one transaction (nothing is written if one statement fails)
+        # new_categories: iterable of (cat_name, ix)
+        # assignments: iterable of dicts {"index": competitor index, "category": cat_name}
+        # deleted_categories: iterable of category indices
+        with self.transaction():
+            self.insert_categories(new_categories)
+            self.update_or_insert_many_cmd(queries.UPDATE_COMPETITOR_CATEGORY, assignments)
+            self.update_or_insert_many_cmd(
+                queries.SOFT_DELETE_CATEGORY, ({"index": ix} for ix in deleted_categories)
+            )
 
-        cmd = f"""
-            INSERT INTO "main"."competitors" ("index", "last", "first", "birthyear", "belt", "club", "regcategory", "weight", "visible", "category", "deleted", "country", "id", "seeding", "clubseeding", "comment", "coachid")
-            VALUES ('{index}', '{last}', '{first}', '{birthyear}', '{belt}', '{club}', '{regcategory}', '{weight}', '{visible}', '{category}', '{deleted}', '{country}', '{id}', '{seeding}', '{clubseeding}', '{comment}', '{coachid}');
-        """
-        return self.update_or_insert_cmd(cmd)
+        return 0
+
+    def sync_competitors(
+        self,
+        competitors,
+        key_columns=("last", "first", "birthyear"),
+        compare_columns=("club", "country", "category", "weight"),
+        protected_columns=("category", "weight"),
+        last_import=None,
+    ):
+        # bring the competitors table in line with `competitors` (e.g. a new
+        # registration export): insert new, update changed, soft-delete missing
+        # the DB index of every competitor is written back into `competitors`
+        # protected_columns are only taken from `competitors` if the DB still
+        # holds the value of the last import (last_import: index -> competitor),
+        # otherwise they were changed in JudoShiai (weigh-in, moved) and are kept
+
+        def keys(rows):
+            # same person may be registered more than once -> count occurrences
+            seen = collections.Counter()
+            for row in rows:
+                key = tuple(str(row[c]).strip().lower() for c in key_columns)
+                seen[key] += 1
+                yield key + (seen[key],)
+
+        existing = self.get_all_competitors()
+        existing_by_key = dict(zip(keys(existing), existing))
+        next_index = max([c["index"] for c in existing] + [9]) + 1
+
+        inserted = []
+        updated = []
+        unchanged = []
+        kept = []
+        for key, competitor in zip(keys(competitors), competitors):
+            old = existing_by_key.pop(key, None)
+
+            if old is None:
+                competitor["index"] = next_index
+                next_index += 1
+                inserted.append(competitor)
+                continue
+
+            competitor["index"] = old["index"]
+            competitor["deleted"] = old["deleted"] & ~1  # keep other flags
+
+            imported = (last_import or {}).get(old["index"])
+            is_kept = False
+            for c in protected_columns:
+                if imported is None or old[c] != imported[c]:
+                    is_kept = is_kept or old[c] != competitor[c]
+                    competitor[c] = old[c]
+            if is_kept:
+                kept.append(competitor)
+            is_changed = any(old[c] != competitor[c] for c in compare_columns)
+            if is_changed or old["deleted"] & 1:
+                updated.append(competitor)
+            else:
+                unchanged.append(competitor)
+
+        deleted = [c for c in existing_by_key.values() if not c["deleted"] & 1]
+
+        with self.transaction():
+            self.insert_competitors(inserted)
+            self.update_competitors(
+                updated, columns=[*key_columns, *compare_columns, "deleted"]
+            )
+            self.soft_delete_competitors([c["index"] for c in deleted])
+
+        summary = {
+            "inserted": inserted,
+            "updated": updated,
+            "deleted": deleted,
+            "unchanged": unchanged,
+            "kept": kept,
+        }
+        return summary
 
 
 # only useable when JudoShiai is running
-class JudoShiaiConnector_WEB:
+class JudoShiaiConnector_WEB(JudoShiaiQueries):
 
-    def __init__(self, host="localhost"):
+    def __init__(
+        self,
+        host="localhost",
+        pool_size=4,
+        timeout=(3.05, 10),
+        retries=3,
+        backoff_factor=0.3,
+    ):
         self.host = host
         self.port = 8088
         self.port_ws = 2315
-
-    def select_cmd(self, cmd):
+        self.timeout = timeout  # (connect, read) in seconds
+
+        # keep-alive session, shared by all queries of this connector
+        retry = Retry(
+            total=retries,
+            backoff_factor=backoff_factor,
+            status_forcelist=[502, 503, 504],
+            allowed_methods=["POST"],  # only SQL-queries are sent via POST
+        )
+        adapter = HTTPAdapter(
+            pool_connections=1, pool_maxsize=pool_size, max_retries=retry
+        )
+        self.session = requests.Session()
+        self.session.headers.update({"Content-Type": "application/json; charset=utf-8"})
+        self.session.mount("http://", adapter)
+
+        # websocket for sending results, see `channel`
+        self._channel = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def close(self):
+        # shut down all pooled connections
+        self.session.close()
+        if self._channel is not None:
+            self._channel.close()
+
+    def select_cmd(self, cmd, params=None):
         # curl -X POST -H 'Content-Type: application/json' -d '{"op": "sql", "pw": "PASSWD", "cmd":"SELECT agetext, weighttext FROM main.catdef"}' http://localhost:8088/json
+        # the JSON-API has no parameter support -> bind as escaped literals
+        if params:
+            cmd = queries.bind_literals(cmd, params)
+
         url = f"http://{self.host}:{self.port}/json"
-        headers = {"Content-Type": "application/json; charset=utf-8"}
         json_data = {"op": "sql", "pw": "PASSWD", "cmd": cmd}
         
         print(" ".join([l.strip() for l in cmd.split("\n")]))
 
-        response = requests.post(url, headers=headers, json=json_data)
+        response = self.session.post(url, json=json_data, timeout=self.timeout)
         response.encoding = "utf-8"
 
         res_list = []
@@ -97,61 +403,31 @@ class JudoShiaiConnector_WEB:
 
         return res_list
 
-    def get_categories(self):
-        cmd = """
-        SELECT "index", category, numcomp, pos1, pos2, pos3, pos4
-        FROM "main"."categories" 
-        WHERE deleted == 0 ;
-        """
-        return self.select_cmd(cmd)
-
-    def get_category_info(self, cid):
-        cmd = f"""
-        SELECT category, numcomp, pos1, pos2, pos3, pos4
-        FROM "main"."categories"
-        WHERE "index" == {cid} ;
-        """
-        return self.select_cmd(cmd)[0]
-
-    def get_match_info(self, cid, mid):
-        cmd = f"""
-        SELECT blue, white, blue_points, white_points
-        FROM "main"."matches"
-        WHERE "category" == {cid} AND "number" == {mid} ;
-        """
-        return self.select_cmd(cmd)[0]
-
-    def get_competitors_of_category(self, cat_label):
-        cmd = f"""
-        SELECT last, first, club, birthyear, country, category, weight
-        FROM "main"."competitors"
-        WHERE "category" == "{cat_label}" ;
-        """
-        return self.select_cmd(cmd)
-
-    def get_competitor_info(self, cid):
-        cmd = f"""
-        SELECT last, first, club, birthyear, country
-        FROM "main"."competitors"
-        WHERE "index" == {cid} ;
-        """
-        
-        if cid == "0":
-            return ["unknown", "", "", "", ""]
-        elif cid == "1":
-            return ["empty", "", "", "", ""]
-        else:
-            return self.select_cmd(cmd)[0]
-
-    def get_matches(self, category_id):
-        cmd = f"""
-        SELECT category, number, blue_points, white_points
-        FROM "main"."matches" 
-        WHERE category == {category_id} ;
-        """
-        return self.select_cmd(cmd)
-
     def set_match_result(self, category_id, match_id, blue_score, white_score):
+        # blocking variant, returns True if JudoShiai acknowledged the result
+        future = self.submit_match_result(
+            category_id, match_id, blue_score, white_score
+        )
+        return future.result(timeout=self.channel.timeout)
+
+    def submit_match_result(self, category_id, match_id, blue_score, white_score):
+        # non-blocking variant, returns a future that resolves with the ACK
+        msg_json = self.result_msg(category_id, match_id, blue_score, white_score)
+        return self.channel.submit(msg_json)
+
+    def submit_match_results(self, results):
+        # send many results as one batch, returns one future per result
+        # results: iterable of (category_id, match_id, blue_score, white_score)
+        msgs = [self.result_msg(*result) for result in results]
+        return self.channel.submit_many(msgs)
+
+    def reset_match_results(self, matches):
+        # clear all given matches as one batch, returns one future per match
+        # matches: iterable of (category_id, match_id, ...)
+        results = [(m[0], m[1], 0x0, 0x0) for m in matches]
+        return self.submit_match_results(results)
+
+    def result_msg(self, category_id, match_id, blue_score, white_score):
         
         msg = {
             "msg": [
@@ -174,18 +450,230 @@ class JudoShiaiConnector_WEB:
             ]
         }
 
-        msg_json = json.dumps(msg)
         print(msg)
 
+        return json.dumps(msg)
+
+    @property
+    def channel(self):
+        # websocket is only opened when the first result is sent
+        if self._channel is None:
+            self._channel = JudoShiaiResultChannel(
+                f"ws://{self.host}:{self.port_ws}", timeout=self.timeout[1]
+            )
+        return self._channel
+
+
+# long-lived websocket to JudoShiai, used by JudoShiaiConnector_WEB
+class JudoShiaiResultChannel:
+
+    def __init__(self, url, timeout=10):
+        self.url = url
+        self.timeout = timeout
+
+        self.ws = None
+        self.lock = threading.Lock()
+
+        # messages sent but not yet acknowledged, JudoShiai ACKs in order
+        # entries: [msg_json, future, time sent]
+        self.pending = collections.deque()
+
+        # how often the reader checks for expired messages (seconds)
+        self.poll_interval = min(1.0, timeout)
+
+    def submit(self, msg_json):
+        return self.submit_many([msg_json])[0]
+
+    def submit_many(self, msgs_json):
+        futures = [Future() for _ in msgs_json]
+
+        with self.lock:
+            now = time.monotonic()
+            self.pending.extend([msg_json, future, now] for msg_json, future in zip(msgs_json, futures))
+            try:
+                if self.ws is None:
+                    self._connect()
+                else:
+                    for msg_json in msgs_json:
+                        self.ws.send(msg_json)
+            except Exception:
+                self._reconnect()
+
+        return futures
+
+    def close(self):
+        with self.lock:
+            ws = self.ws
+            self.ws = None
+            self._fail_pending(ConnectionError("Result channel closed"))
+
+        if ws is not None:
+            ws.close()
+
+    def _connect(self):
+        # open socket, (re-)send everything still waiting for an ACK
         ws = websocket.WebSocket()
-        ws.connect(f"ws://{self.host}:{self.port_ws}")
-        ws.send(msg_json)
+        ws.connect(self.url, timeout=self.timeout)
+        ws.settimeout(self.poll_interval)
+        for entry in self.pending:
+            ws.send(entry[0])
+            entry[2] = time.monotonic()
+        self.ws = ws
+
+        reader = threading.Thread(target=self._read_acks, args=(ws,), daemon=True)
+        reader.start()
+
+    def _reconnect(self):
+        # caller needs to hold the lock
+        if self.ws is not None:
+            self.ws.close()
+            self.ws = None
+
+        try:
+            self._connect()
+        except Exception as e:
+            print(f"Could not connect to {self.url}: {e}")
+            self._fail_pending(e)
+
+    def _expire_pending(self):
+        # caller needs to hold the lock
+        # fail messages without ACK for `timeout` seconds. A MSG_ACK does not
+        # tell which result it belongs to, so a late ACK would be matched to
+        # the next message -> start over on a new socket (the remaining
+        # messages are sent again, late ACKs on the old socket are ignored)
+        deadline = time.monotonic() - self.timeout
+        if not self.pending or self.pending[0][2] > deadline:
+            return
+
+        while self.pending and self.pending[0][2] <= deadline:
+            _, future, _ = self.pending.popleft()
+            if not future.done():
+                future.set_exception(TimeoutError("No MSG_ACK received"))
+
+        self._reconnect()
+
+    def _fail_pending(self, exception):
+        while self.pending:
+            _, future, _ = self.pending.popleft()
+            # may already be cancelled by the caller
+            if not future.done():
+                future.set_exception(exception)
+
+    def _read_acks(self, ws):
+        while self.ws is ws:
+            try:
+                with self.lock:
+                    if self.ws is ws:
+                        self._expire_pending()
+                if self.ws is not ws:
+                    return
+
+                try:
+                    frame = ws.recv()
+                except websocket.WebSocketTimeoutException:
+                    # nothing received for a while, check for expired messages
+                    continue
+
+                # ignore anything else JudoShiai broadcasts (and malformed frames)
+                try:
+                    is_ack = json.loads(frame)["msg"][1] == 3
+                except (ValueError, TypeError, KeyError, IndexError):
+                    is_ack = False
+                if not is_ack:
+                    continue
+
+                with self.lock:
+                    # ACK of a socket we already gave up on
+                    if self.ws is not ws:
+                        return
+                    if self.pending:
+                        _, future, _ = self.pending.popleft()
+                        # may already be cancelled by the caller, the ACK is consumed anyway
+                        if not future.done():
+                            future.set_result(True)
+
+            except Exception as e:
+                # socket closed / broken, otherwise the reader would die silently
+                # and leave the pending messages unanswered
+                with self.lock:
+                    if self.ws is ws:
+                        try:
+                            self._reconnect()
+                        except Exception:
+                            self.ws = None
+                            self._fail_pending(e)
+                return
+
+
+# asyncio-facade of the WEB-connector, for use inside async Flet handlers
+class AsyncJudoShiaiConnector:
+
+    def __init__(self, host="localhost", **kwargs):
+        # blocking calls run in worker threads and share the connection pool
+        self.jsc = JudoShiaiConnector_WEB(host, **kwargs)
+        self.host = host
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        await self.close()
+
+    async def close(self):
+        await asyncio.to_thread(self.jsc.close)
+
+    async def select_cmd(self, cmd, params=None):
+        return await asyncio.to_thread(self.jsc.select_cmd, cmd, params)
+
+    async def get_categories(self):
+        return await asyncio.to_thread(self.jsc.get_categories)
+
+    async def get_category_info(self, cid):
+        return await asyncio.to_thread(self.jsc.get_category_info, cid)
+
+    async def get_match_info(self, cid, mid):
+        return await asyncio.to_thread(self.jsc.get_match_info, cid, mid)
+
+    async def get_competitors_of_category(self, cat_label):
+        return await asyncio.to_thread(self.jsc.get_competitors_of_category, cat_label)
+
+    async def get_competitors_of_categories(self, cat_labels):
+        return await asyncio.to_thread(self.jsc.get_competitors_of_categories, cat_labels)
+
+    async def get_competitor_info(self, cid):
+        return await asyncio.to_thread(self.jsc.get_competitor_info, cid)
+
+    async def get_matches(self, category_id):
+        return await asyncio.to_thread(self.jsc.get_matches, category_id)
+
+    async def get_category_bundle(self, cid):
+        # both queries are sent concurrently
+        params = {"cid": int(cid)}
+        rows, competitor_rows = await asyncio.gather(
+            self.select_cmd(queries.CATEGORY_BUNDLE_MATCHES, params),
+            self.select_cmd(queries.CATEGORY_BUNDLE_COMPETITORS, params),
+        )
+        return self.jsc.build_category_bundle(rows, competitor_rows)
+
+    async def set_match_result(self, category_id, match_id, blue_score, white_score):
+        # (re-)connecting the websocket may block, so submit from a thread
+        future = await asyncio.to_thread(
+            self.jsc.submit_match_result, category_id, match_id, blue_score, white_score
+        )
+        # shield: a timeout here must not cancel the future waiting in the channel
+        return await asyncio.wait_for(
+            asyncio.shield(asyncio.wrap_future(future)), timeout=self.jsc.channel.timeout
+        )
+
+    async def submit_match_results(self, results):
+        # returns asyncio futures, one per result
+        futures = await asyncio.to_thread(self.jsc.submit_match_results, results)
+        return [asyncio.wrap_future(f) for f in futures]
 
-        msg_ack = json.loads(ws.recv())
-        if msg_ack["msg"][1] != 3:
-            print(msg_ack)
-            print("Did not receive MSG_ACK  ")
-        ws.close()
+    async def reset_match_results(self, matches):
+        # returns asyncio futures, one per match
+        futures = await asyncio.to_thread(self.jsc.reset_match_results, matches)
+        return [asyncio.wrap_future(f) for f in futures]
 
 
 if __name__ == "__main__":
@@ -195,8 +683,8 @@ if __name__ == "__main__":
     #)
     #print(jsc_offline.get_category_definitions())
 
-    jsc_online = JudoShiaiConnector_WEB()
-    print(jsc_online.get_categories())
-    #print(jsc_online.get_matches(10014))
-    #print(jsc_online.get_competitor_info(29))
-    jsc_online.set_match_result(10014, 1, 0x10000, 0x01000) 
+    with JudoShiaiConnector_WEB() as jsc_online:
+        print(jsc_online.get_categories())
+        #print(jsc_online.get_matches(10014))
+        #print(jsc_online.get_competitor_info(29))
+        jsc_online.set_match_result(10014, 1, 0x10000, 0x01000)
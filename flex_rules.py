@@ -0,0 +1,123 @@
+import json
+
+import numpy as np
+
+
+# constraints + objective for flexible weight categories
+# - hard constraints decide which competitors may share a group
+#   (weight ratio, absolute weight gap, group size)
+# - the objective rates a valid group, a partition costs the sum over its groups
+#   (plus, optionally, the variance of the group sizes across the partition)
+class FlexRules:
+
+    def __init__(
+        self,
+        max_weight_ratio=1.1,
+        max_gap_kg=None,
+        min_group_size=1,
+        max_group_size=None,
+        preferred_size=(4, 5),
+        singleton_penalty=10.0,
+        variance_penalty=0.0,
+        size_variance_penalty=0.0,
+    ):
+        # constraints
+        self.max_weight_ratio = max_weight_ratio  # heaviest <= ratio * lightest
+        self.max_gap_kg = max_gap_kg  # heaviest - lightest <= gap
+        self.min_group_size = min_group_size
+        self.max_group_size = max_group_size
+
+        # objective
+        self.preferred_size = tuple(preferred_size)
+        self.singleton_penalty = singleton_penalty
+        self.variance_penalty = variance_penalty  # per kg^2 of weight variance within a group
+        self.size_variance_penalty = size_variance_penalty  # per unit of variance of the group sizes
+
+    @classmethod
+    def from_file(cls, path, category=None, **overrides):
+        # JSON file, either options for all categories or options per
+        # category prefix, e.g. {"default": {...}, "u12": {...}, "u15w": {...}}
+        # (longest matching prefix wins), `overrides` that are not None win
+        with open(path, "r", encoding="UTF-8") as f:
+            rules = json.load(f)
+
+        if any(isinstance(v, dict) for v in rules.values()):
+            options = dict(rules.get("default", {}))
+            if category is not None:
+                prefixes = [p for p in rules if p != "default" and category.startswith(p)]
+                if prefixes:
+                    options.update(rules[max(prefixes, key=len)])
+        else:
+            options = dict(rules)
+
+        options.update({k: v for k, v in overrides.items() if v is not None})
+        return cls(**options)
+
+    def as_dict(self):
+        return {
+            "max_weight_ratio": self.max_weight_ratio,
+            "max_gap_kg": self.max_gap_kg,
+            "min_group_size": self.min_group_size,
+            "max_group_size": self.max_group_size,
+            "preferred_size": list(self.preferred_size),
+            "singleton_penalty": self.singleton_penalty,
+            "variance_penalty": self.variance_penalty,
+            "size_variance_penalty": self.size_variance_penalty,
+        }
+
+    def band(self, weights_sorted, stop=None):
+        # who is allowed to compete with whom?
+        # For sorted weights (grams) the compatible partners of i are one
+        # contiguous interval [lo, hi), so we store N intervals instead of a N x N matrix
+        # (only for the first `stop` competitors if given)
+        w = np.asarray(weights_sorted, dtype=float)
+        v = w[:stop]
+
+        lo = np.searchsorted(self.max_weight_ratio * w, v, side="left")
+        hi = np.searchsorted(w, self.max_weight_ratio * v, side="right")
+
+        if self.max_gap_kg is not None:
+            gap = 1000 * self.max_gap_kg
+            lo = np.maximum(lo, np.searchsorted(w, v - gap, side="left"))
+            hi = np.minimum(hi, np.searchsorted(w, v + gap, side="right"))
+
+        return np.column_stack([lo, hi])
+
+    def prefix_sums(self, weights_sorted):
+        # S1[i] / S2[i]: sum of weights / squared weights (kg) of the first i
+        # competitors -> statistics of any group [s, e) in O(1)
+        kg = np.asarray(weights_sorted, dtype=float) / 1000
+        S1 = np.concatenate([[0.0], np.cumsum(kg)])
+        S2 = np.concatenate([[0.0], np.cumsum(kg**2)])
+        return S1, S2
+
+    def group_sizes(self, band, start):
+        # valid sizes of a group starting at `start` (everybody compatible with the lightest)
+        largest = band[start, 1] - start
+        if self.max_group_size is not None:
+            largest = min(largest, self.max_group_size)
+        return np.arange(max(self.min_group_size, 1), largest + 1)
+
+    def group_costs(self, prefix, start, sizes):
+        # cost of the groups [start, start + size) for all `sizes` at once
+        sizes = np.asarray(sizes)
+
+        # squared distance of the group size to the preferred pool size
+        distance = np.maximum(
+            np.maximum(self.preferred_size[0] - sizes, 0), sizes - self.preferred_size[1]
+        )
+        costs = (distance**2).astype(float)
+
+        # competitors without opponent
+        costs += np.where(sizes == 1, self.singleton_penalty, 0.0)
+
+        # spread of weights within the group
+        if self.variance_penalty:
+            S1, S2 = prefix
+            end = start + sizes
+            s1 = S1[end] - S1[start]
+            s2 = S2[end] - S2[start]
+            variance = np.maximum(s2 / sizes - (s1 / sizes) ** 2, 0.0)
+            costs += self.variance_penalty * variance
+
+        return costs
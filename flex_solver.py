@@ -0,0 +1,223 @@
+import bisect
+
+import numpy as np
+
+from flex_rules import FlexRules
+
+
+# stateful solver for flexible weight categories, for what-if questions at
+# the weigh-in table (re-weighing, withdrawals, late entries)
+# - groups are contiguous runs in sorted weight order, so the optimal
+#   partition is a shortest path over the positions 0..N (dynamic
+#   programming from the heaviest competitor), keeping the `top_k` best per position
+# - best_*[s] only depends on the competitors s..N-1, a change at sorted
+#   position p therefore only invalidates best_*[0..p]
+# - the variance of the group sizes does not add up per group, but for a fixed
+#   number of groups K it does (var = sum(size^2) / K - (N / K)^2), so with a
+#   size variance penalty there is one DP over (number of groups, position) per K
+class FlexSolver:
+
+    def __init__(self, rules=None, top_k=10):
+        self.rules = FlexRules() if rules is None else rules
+        self.top_k = top_k
+
+        self.weights = []  # grams, sorted
+        self.keys = []  # competitor key per sorted position
+
+        # best_*[s, r]: r-th best partition of the competitors s..N-1 as total cost
+        # (inf: no such partition), size of the first group and rank of the rest
+        # in best_*[s + size]
+        self.best_cost, self.best_size, self.best_rank = self._empty_best(1)
+        self.best_cost[0, 0] = 0.0
+        self.dirty = -1  # best_*[0..dirty] needs to be recomputed
+
+    @classmethod
+    def from_weights(cls, weights, keys=None, rules=None, top_k=10):
+        # keys default to the position in `weights`
+        keys = range(len(weights)) if keys is None else keys
+        solver = cls(rules=rules, top_k=top_k)
+
+        order = sorted(zip(weights, keys), key=lambda x: x[0])
+        solver.weights = [int(w) for w, _ in order]
+        solver.keys = [k for _, k in order]
+        solver.best_cost, solver.best_size, solver.best_rank = solver._empty_best(len(order) + 1)
+        solver.best_cost[-1, 0] = 0.0
+        solver.dirty = len(order) - 1
+        return solver
+
+    def __len__(self):
+        return len(self.weights)
+
+    def add_competitor(self, key, weight):
+        weight = int(weight)
+        p = bisect.bisect_right(self.weights, weight)
+        self.weights.insert(p, weight)
+        self.keys.insert(p, key)
+        self.best_cost, self.best_size, self.best_rank = (
+            np.insert(best, p, 0, axis=0) for best in (self.best_cost, self.best_size, self.best_rank)
+        )
+        self.dirty = max(self.dirty + (p <= self.dirty), p)
+
+    def remove_competitor(self, key):
+        p = self.keys.index(key)
+        del self.weights[p]
+        del self.keys[p]
+        self.best_cost, self.best_size, self.best_rank = (
+            np.delete(best, p, axis=0) for best in (self.best_cost, self.best_size, self.best_rank)
+        )
+        self.dirty = max(self.dirty - (p <= self.dirty), p - 1)
+
+    def update_weight(self, key, weight):
+        self.remove_competitor(key)
+        self.add_competitor(key, weight)
+
+    def band(self, stop=None):
+        return self.rules.band(self.weights, stop=stop)
+
+    def solve(self):
+        # recompute the invalidated positions, everything behind is reused
+        if self.dirty < 0:
+            return
+
+        band = self.band(stop=self.dirty + 1)
+        prefix = self.rules.prefix_sums(self.weights)
+
+        for start in range(self.dirty, -1, -1):
+            sizes = self.rules.group_sizes(band, start)
+            costs = self.rules.group_costs(prefix, start, sizes)
+
+            # all (size, rank) combinations at once, flat index in (size, rank) order
+            totals = (costs[:, None] + self.best_cost[start + sizes]).ravel()
+            chosen = self._smallest(totals)
+
+            self.best_cost[start] = np.inf
+            self.best_cost[start, : len(chosen)] = totals[chosen]
+            self.best_size[start, : len(chosen)] = sizes[chosen // self.top_k]
+            self.best_rank[start, : len(chosen)] = chosen % self.top_k
+
+        self.dirty = -1
+
+    def solutions(self):
+        # list of (class_path, cost), best first
+        if self.rules.size_variance_penalty:
+            return self._solutions_by_group_count()
+
+        self.solve()
+
+        solutions = []
+        for first in range(self.top_k):
+            cost = self.best_cost[0, first]
+            if not np.isfinite(cost):
+                break
+
+            class_path = []
+            start, rank = 0, first
+            while start < len(self.weights):
+                size = int(self.best_size[start, rank])
+                rank = int(self.best_rank[start, rank])
+                class_path.append(size)
+                start += size
+            solutions.append((class_path, float(cost)))
+
+        return solutions
+
+    def _solutions_by_group_count(self):
+        # best partition for every number of groups K, the top_k of these are the
+        # alternatives; everything is recomputed, meant for single pools
+        n = len(self.weights)
+        if n == 0:
+            return [([], 0.0)]
+
+        group_cost, starts, sizes = self._groups_by_end()
+        if not len(sizes):
+            return []
+        penalty = self.rules.size_variance_penalty
+
+        # lower bound of the cost for every K: cheapest partition without the
+        # size variance + variance of the most even split (sizes n // K and n // K + 1)
+        additive, _ = self._cheapest_by_group_count(group_cost, starts, n)
+        bounds = [
+            (additive[k][n] + penalty * (n % k) * (k - n % k) / k**2, k)
+            for k in range(1, n + 1)
+            if np.isfinite(additive[k][n])
+        ]
+
+        solutions = []
+        for bound, k in sorted(bounds):
+            if len(solutions) == self.top_k and bound >= solutions[-1][1]:
+                break
+
+            cheapest, last = self._cheapest_by_group_count(group_cost + penalty / k * sizes**2, starts, k)
+            cost = float(cheapest[k][n] - penalty * (n / k) ** 2)
+
+            class_path = []
+            end = n
+            for g in range(k, 0, -1):
+                class_path.append(int(last[g][end]))
+                end -= class_path[-1]
+
+            solutions.append((class_path[::-1], cost))
+            solutions = sorted(solutions, key=lambda x: x[1])[: self.top_k]
+
+        return solutions
+
+    def _groups_by_end(self):
+        # group_cost[e, d - 1]: cost of the group [e - d, e), inf if not a valid group
+        n = len(self.weights)
+        band = self.band()
+        prefix = self.rules.prefix_sums(self.weights)
+
+        valid_sizes = [self.rules.group_sizes(band, start) for start in range(n)]
+        sizes = np.arange(1, max((s[-1] for s in valid_sizes if len(s)), default=0) + 1)
+        costs = np.full((n, len(sizes)), np.inf)
+        for start, s in enumerate(valid_sizes):
+            costs[start, s - 1] = self.rules.group_costs(prefix, start, s)
+
+        starts = np.arange(n + 1)[:, None] - sizes
+        group_cost = np.full(starts.shape, np.inf)
+        inside = starts >= 0
+        group_cost[inside] = costs[starts[inside], np.broadcast_to(sizes - 1, starts.shape)[inside]]
+        return group_cost, np.maximum(starts, 0), sizes
+
+    def _cheapest_by_group_count(self, group_cost, starts, n_groups):
+        # cheapest[g][e]: cheapest split of the first e competitors into exactly g
+        # groups, last[g][e]: size of the last of these groups
+        cheapest = [np.concatenate([[0.0], np.full(len(starts) - 1, np.inf)])]
+        last = [None]
+        rows = np.arange(len(starts))
+        for _ in range(n_groups):
+            candidates = cheapest[-1][starts] + group_cost
+            best = np.argmin(candidates, axis=1)
+            cheapest.append(candidates[rows, best])
+            last.append(best + 1)
+        return cheapest, last
+
+    def _empty_best(self, n):
+        return (
+            np.full((n, self.top_k), np.inf),
+            np.zeros((n, self.top_k), dtype=int),
+            np.zeros((n, self.top_k), dtype=int),
+        )
+
+    def _smallest(self, totals):
+        # indices of the top_k smallest finite totals, ties go to the smaller
+        # index (smaller first group, then better rest) -> deterministic results
+        if len(totals) > self.top_k:
+            kth = np.partition(totals, self.top_k - 1)[self.top_k - 1]
+            candidates = np.flatnonzero(totals <= kth)
+        else:
+            candidates = np.arange(len(totals))
+
+        candidates = candidates[np.isfinite(totals[candidates])]
+        order = np.lexsort((candidates, totals[candidates]))
+        return candidates[order][: self.top_k]
+
+    def ranges(self, class_path):
+        # [start, end) of every group in sorted order, lightest group first
+        ends = np.cumsum(class_path).tolist()
+        starts = [0] + ends[:-1]
+        return list(zip(starts, ends))
+
+    def groups(self, class_path):
+        # competitor keys per group, lightest group first
+        return [self.keys[s:e] for s, e in self.ranges(class_path)]
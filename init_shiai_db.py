@@ -1,10 +1,11 @@
 import shutil
 import os
-import copy
-import shlex
-import subprocess
 import json
+import numpy
 import pandas
+import registration
+import tickets
+from templating import SVGTemplate
 from dbutils import JudoShiaiConnector_SQLITE
 import argparse
 
@@ -31,7 +32,7 @@ parser.add_argument(
     "-c",
     "--competitors",
     default=default_competitors,
-    help="xlsx-file with competitors",
+    help="file with competitors (xlsx/ods: sheet 'Meldungen mit DS', or csv/parquet)",
 )
 parser.add_argument(
     "-o",
@@ -70,6 +71,54 @@ parser.add_argument(
     action='store_true',
     help="suppress actual pdf creation",
 )
+parser.add_argument(
+    "--ticket-renderer",
+    choices=tickets.RENDERERS,
+    default="inkscape",
+    help="inkscape: one process per ticket, inkscape-shell: one process per group, cairosvg: pure python (needs cairosvg + pypdf)",
+)
+parser.add_argument(
+    "--ticket-cache-dir",
+    default=os.path.join(cwd, ".ticket_cache"),
+    help="directory to keep rendered tickets, only new/changed tickets are rendered again",
+)
+parser.add_argument(
+    "--no-ticket-cache",
+    action='store_true',
+    help="render all tickets, ignore and do not fill the ticket cache",
+)
+parser.add_argument(
+    "-j",
+    "--jobs",
+    type=int,
+    default=os.cpu_count() or 1,
+    help="number of parallel inkscape processes for ticket creation (default: CPU count)",
+)
+parser.add_argument(
+    "--ticket-timeout",
+    type=float,
+    default=120,
+    help="seconds after which a single ticket conversion is aborted",
+)
+parser.add_argument(
+    "--ticket-retries",
+    type=int,
+    default=1,
+    help="how often a failed ticket conversion is retried",
+)
+
+parser.add_argument(
+    "-u",
+    "--update",
+    action='store_true',
+    help="update competitors of an existing shi-DB instead of creating a new one",
+)
+
+parser.add_argument(
+    "--overwrite-weigh-in",
+    action='store_true',
+    help="with --update: also overwrite weights/categories changed in JudoShiai since the last import",
+)
 
 # parse CLI arguments
 args = parser.parse_args()
@@ -79,26 +128,40 @@ competitors_xlsx = args.competitors
 competitors_json = os.path.join(output_directory, f"competitors_{args.name}.json")
 shi_path = os.path.join(output_directory, f"{args.name}.shi")
 
-# stop if file already existing
-if os.path.exists(shi_path):
-    print(
-        f"\nTarget path <{shi_path}> already exists.\nPlease rename or delete to proceed.\n"
-    )
-    exit()
+if args.update:
+    # stop if there is nothing to update
+    if not os.path.exists(shi_path):
+        print(f"\nTarget path <{shi_path}> does not exist.\nRun without --update first.\n")
+        exit()
+
+    # existing DB -> keep the default (durable) journal
+    db = JudoShiaiConnector_SQLITE(db_path=shi_path)
+
+else:
+    # stop if file already existing
+    if os.path.exists(shi_path):
+        print(
+            f"\nTarget path <{shi_path}> already exists.\nPlease rename or delete to proceed (or use --update).\n"
+        )
+        exit()
+
+    # copy template
+    shutil.copy(template, shi_path)
 
-# copy template
-shutil.copy(template, shi_path)
+    # connect to shi file
+    # (fresh copy of the template -> no need for a durable journal while building)
+    db = JudoShiaiConnector_SQLITE(db_path=shi_path, journal_mode="MEMORY", synchronous="OFF")
 
-# connect to shi file
-db = JudoShiaiConnector_SQLITE(db_path=shi_path)
+    # init categories
+    catdefs = db.get_category_definitions()
+    categories = []
+    for i, catdef in enumerate(catdefs):
+        ix = i + 10013
+        cat_name = catdef[0] + catdef[1]
 
-# init categories
-catdefs = db.get_category_definitions()
-for i, catdef in enumerate(catdefs):
-    ix = i + 10013
-    cat_name = catdef[0] + catdef[1]
+        categories.append((cat_name, ix))
 
-    db.insert_category(cat_name, ix)
+    db.insert_categories(categories)
 
 
 # init competitors
@@ -131,94 +194,143 @@ def age_cat_from_age_and_gender(age_raw, gender_raw):
     return age_cat
 
 
-with open(competitors_xlsx, "rb") as f:
-    df = pandas.read_excel(f, sheet_name="Meldungen mit DS", dtype={"WeightCat": str})
+def derive_competitors(df):
+    # derive all fields column-wise instead of row by row
+    df_valid = df[df["Name"].notna()]
+    if df_valid.empty:
+        return [], []
 
-competitors = []
+    # age category: only evaluate each (AgeCat, Gender) combination once
+    age_gender = pandas.MultiIndex.from_frame(df_valid[["AgeCat", "Gender"]])
+    age_cats = {ag: age_cat_from_age_and_gender(*ag) for ag in age_gender.unique()}
+    age_cat = pandas.Series(age_gender.map(age_cats), index=df_valid.index)
 
-for i, row in df.iterrows():
+    gender = pandas.Series(numpy.where(df_valid["Gender"] == "female", 2, 1), index=df_valid.index)
 
-    if pandas.notna(row["Name"]):
-
-        age_cat = age_cat_from_age_and_gender(row["AgeCat"], row["Gender"])
-        gender = 2 if row["Gender"] == "female" else 1
-
-        if args.ignore_weight_cat:
-            weight_cat = "?"
-            weight = 1000
-        else:
-            weight_cat = ""
-            weight = 0
-            if pandas.notna(row["WeightCat"]):
-                raw_weight_cat = row["WeightCat"]
-                weight = int(raw_weight_cat) * 1000
-                if raw_weight_cat[0] != "+":
-                    raw_weight_cat = "-" + raw_weight_cat
-                weight_cat = raw_weight_cat + "kg"
-        cat = f"{age_cat} {weight_cat}"
-
-        birthyear = int(row["Born"]) if pandas.notna(row["Born"]) else 0
-        country = row["Nation"] if pandas.notna(row["Nation"]) else ""
-
-        competitor = {
-            "ix": i + 10,
-            "last": row["Name"],
-            "first": row["FirstName"],
-            "club": row["Club"],
+    if args.ignore_weight_cat:
+        weight_cat = "?"
+        weight = 1000
+    else:
+        raw_weight_cat = df_valid["WeightCat"]
+        has_weight_cat = raw_weight_cat.notna()
+        weight = raw_weight_cat.where(has_weight_cat, "0").astype(int) * 1000
+        weight_cat = raw_weight_cat.where(raw_weight_cat.str[0] == "+", "-" + raw_weight_cat) + "kg"
+        weight_cat = weight_cat.where(has_weight_cat, "")
+
+    competitors_df = pandas.DataFrame(
+        {
+            "ix": df_valid.index + 10,
+            "last": df_valid["Name"],
+            "first": df_valid["FirstName"],
+            "club": df_valid["Club"],
             "regcat": "",
-            "category": cat,
-            "country": country,
+            "category": age_cat + " " + weight_cat,
+            "country": df_valid["Nation"].fillna(""),
             "id": "",
             "comment": "",
             "coachid": "",
-            "birthyear": birthyear,
+            "birthyear": pandas.to_numeric(df_valid["Born"], errors="coerce").fillna(0).astype(int),
             "belt": 0,
             "weight": weight,
             "flags": 0,
             "seeding": 0,
             "clubseeding": 0,
             "gender": gender,
-        }
-
-        competitor_db = {
-            "index": competitor["ix"],
-            "last": competitor["last"],
-            "first": competitor["first"],
-            "birthyear": competitor["birthyear"],
-            "belt": competitor["belt"],
-            "club": competitor["club"],
-            "regcategory": competitor["regcat"],
-            "weight": competitor["weight"],
-            "visible": 1,
-            "category": competitor["category"],
-            "deleted": 0,
-            "country": competitor["country"],
-            "id": competitor["id"],
-            "seeding": competitor["seeding"],
-            "clubseeding": competitor["clubseeding"],
-            "comment": competitor["comment"],
-            "coachid": competitor["coachid"],
-        }
-        db.insert_competitor(**competitor_db)
+        },
+        index=df_valid.index,
+    )
+
+    competitors_db_df = competitors_df.rename(columns={"ix": "index", "regcat": "regcategory"})
+    competitors_db_df["visible"] = 1
+    competitors_db_df["deleted"] = 0
+    competitors_db_df = competitors_db_df[db.competitor_columns]
+
+    return competitors_df.to_dict("records"), competitors_db_df.to_dict("records")
+
+
+def iter_competitors(chunks):
+    # generator pipeline: sheet rows -> (competitor for json, competitor for DB)
+    for df_chunk in chunks:
+        for competitor, competitor_db in zip(*derive_competitors(df_chunk)):
+            yield competitor, competitor_db
+
+
+def tee_json(pairs, f):
+    # write each competitor into the json list while passing on the DB row
+    # (same output as json.dump(competitors, f, indent=1))
+    f.write("[")
+    n = 0
+    for competitor, competitor_db in pairs:
+        f.write(",\n " if n else "\n ")
+        f.write(json.dumps(competitor, indent=1, ensure_ascii=False).replace("\n", "\n "))
+        n += 1
+        yield competitor_db
+    f.write("\n]" if n else "]")
+
+
+# read registration sheet lazily, keep chunks only if needed for the tickets
+ticket_frames = []
 
+
+def read_chunks():
+    for df_chunk in registration.iter_chunks(competitors_xlsx):
+        if args.create_tickets:
+            ticket_frames.append(df_chunk)
+        yield df_chunk
+
+
+# all competitors in one transaction
+if args.update:
+    # what the sheet produced at the last import -> detect weights/categories
+    # that were changed in JudoShiai since then (weigh-in, flex groups, ...)
+    last_import = {}
+    if os.path.exists(competitors_json):
+        with open(competitors_json, "r", encoding="utf8") as f:
+            last_import = {c["ix"]: c for c in json.load(f)}
+
+    competitors, competitors_db = [], []
+    for competitor, competitor_db in iter_competitors(read_chunks()):
         competitors.append(competitor)
+        competitors_db.append(competitor_db)
+
+    if args.overwrite_weigh_in:
+        changes = db.sync_competitors(competitors_db, protected_columns=())
+    else:
+        changes = db.sync_competitors(competitors_db, last_import=last_import)
 
-with open(competitors_json, "w", encoding="utf8") as f:
-    json.dump(competitors, f, indent=1, ensure_ascii=False)
+    print("\nChanges:")
+    for change, changed_competitors in changes.items():
+        print(f"  {change}: {len(changed_competitors)}")
+        if change != "unchanged":
+            for c in changed_competitors:
+                print(f"    {c['last']}, {c['first']} ({c['club']}), {c['category']}")
+
+    # keep json in line with the DB
+    for competitor, competitor_db in zip(competitors, competitors_db):
+        competitor["ix"] = competitor_db["index"]
+
+    with open(competitors_json, "w", encoding="utf8") as f:
+        json.dump(competitors, f, indent=1, ensure_ascii=False)
+
+else:
+    # rows flow from the sheet into the DB insert and the json dump at once
+    with open(competitors_json, "w", encoding="utf8") as f:
+        db.insert_competitors(tee_json(iter_competitors(read_chunks()), f))
+db.close()
 
 # create tickets
 if args.create_tickets:
     debug_mode = args.ticket_debug_mode
 
-    # read inkscape template
-    template = open(args.ticket_template, "r").read()
+    # read and compile inkscape template
+    ticket_placeholders = ['__Name__', '__FirstName__', '__Club__', '__AgeCat__', '__Nation__', '__WeightCat__', '__Weight__']
+    template = SVGTemplate.from_file(args.ticket_template, ticket_placeholders)
 
-    # make temporary folder
-    tmp_folder = os.path.join(cwd, "tmp")
-    if not os.path.exists(tmp_folder):
-        os.mkdir(tmp_folder)
+    if not args.no_ticket_cache:
+        ticket_cache = tickets.TicketCache(args.ticket_cache_dir, template.text, args.ticket_renderer)
 
     # group by age and gender
+    df = pandas.concat(ticket_frames)
     groups = df.groupby(["Gender"]) # ["AgeCat", "Gender"]
 
     for name, df_group in groups:
@@ -226,10 +338,8 @@ if args.create_tickets:
         # sort
         df_group = df_group.sort_values(["Club", "Name"]).fillna("")  # ["Weight", "Club", "Name"]
 
-        # keep track of produced temporary files
-        pdf_paths = []
-        svg_paths = []
-        inkscape_processes = []
+        documents = []
+        ticket_keys = []
 
         print("Group: ", name)
 
@@ -257,43 +367,51 @@ if args.create_tickets:
                             '__WeightCat__': row['WeightCat'],
                             '__Weight__': row['Weight'] }
 
+            # only (re-)render tickets that are new or changed
+            ticket_id = "{ID:04d}".format(ID=int(row["#"]))
+            if not args.no_ticket_cache:
+                key = ticket_cache.key(replacements)
+                if key in ticket_cache or key in ticket_keys:
+                    ticket_keys.append(key)
+                    continue
+                ticket_keys.append(key)
+                ticket_id = f"{ticket_id}_{key}"
+
             # substitue in inkscape template
-            tmp = copy.copy(template)
-            for placeholder, replacement in replacements.items():
-                tmp = tmp.replace(placeholder, replacement)
+            tmp = template.render(replacements)
             
-            # define output paths
-            svg_path = os.path.join(tmp_folder, "{ID:04d}.svg".format(ID=row["#"]))
-            pdf_path = os.path.join(tmp_folder, "{ID:04d}.pdf".format(ID=row["#"]))
-            svg_paths.append(svg_path)
-            pdf_paths.append(pdf_path)
-
-            # write svg
-            svg_file = open(svg_path, "w")
-            svg_file.write(tmp)
-            svg_file.close()
-
-            # convert inkscape to pdf
-            cmd_args = shlex.split("inkscape \"{SVG}\" --export-area-page --export-filename=\"{PDF}\"".format(SVG=svg_path, PDF=pdf_path))
-            if not debug_mode:
-                p = subprocess.Popen(cmd_args)
-                inkscape_processes.append(p)
-
-        # all processes were started in parallel, wait until all have finished before continuing 
-        exit_codes = [p.wait() for p in inkscape_processes]
-
-        # combine all pdf into single pdf for agecat
-        input_paths = ' '.join(pdf_paths)
+            documents.append((ticket_id, tmp))
+
         output_path = os.path.join(cwd, '{NAME}_{CAT}.pdf'.format(NAME=args.name, CAT=name[0]))
-        s = "gs -q -dNOPAUSE -dBATCH -sDEVICE=pdfwrite -sOutputFile={OUT} {IN}".format(OUT=output_path, IN=input_paths)
-        cmd_args = shlex.split(s)
-
-        if not debug_mode:
-            p = subprocess.Popen(cmd_args)
-            p.communicate()
-
-        # delete artifacts
-        for path in svg_paths + pdf_paths:
-            if os.path.exists(path):
-                os.remove(path)
-                
\ No newline at end of file
+
+        if debug_mode:
+            continue
+
+        if not args.no_ticket_cache:
+            print(f"{len(ticket_keys) - len(documents)} of {len(ticket_keys)} tickets taken from cache")
+
+        # temporary files only live in a (RAM-backed) scratch dir that is
+        # removed again, even if rendering fails half-way
+        with tickets.scratch_dir() as scratch:
+            if args.ticket_renderer == "cairosvg":
+                pdf_paths, failed = tickets.render_cairosvg(documents, scratch)
+            elif args.ticket_renderer == "inkscape-shell":
+                pdf_paths, failed = tickets.render_inkscape_shell(documents, scratch, args.ticket_timeout)
+            else:
+                pdf_paths, failed = tickets.render_inkscape(documents, scratch, args.jobs, args.ticket_timeout, args.ticket_retries)
+
+            # assemble group from cached pages (in the original order)
+            if not args.no_ticket_cache:
+                for pdf_path in pdf_paths:
+                    key = os.path.splitext(os.path.basename(pdf_path))[0].split("_")[-1]
+                    ticket_cache.store(key, pdf_path)
+                pdf_paths = [ticket_cache.path(key) for key in ticket_keys if key in ticket_cache]
+
+            # combine all pdf into single pdf for agecat
+            if pdf_paths:
+                tickets.merge_pdfs(pdf_paths, output_path, use_gs=args.ticket_renderer != "cairosvg")
+
+        if failed:
+            print(f"Could not create {len(failed)} ticket(s):")
+            for ticket_id in sorted(failed):
+                print("  ", ticket_id)
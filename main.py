@@ -26,7 +26,7 @@ parser.add_argument(
 args = parser.parse_args()
 
 
-def main(page: ft.Page):
+async def main(page: ft.Page):
     print("Initial route:", page.route)
     app = MatchApp(page, host=args.host)
     page.go(page.route)
@@ -0,0 +1,176 @@
+import math
+import re
+
+# SQL used by the connectors in `dbutils`, with named parameters (:name)
+# - SQLITE-connector passes them to sqlite3 (statement stays cacheable)
+# - WEB-connector binds them client-side via `bind_literals`
+
+CATEGORY_DEFINITIONS = """
+    SELECT agetext, weighttext
+    FROM "main"."catdef" ;
+"""
+
+INSERT_CATEGORY = """
+    INSERT INTO "main"."categories" ("index", "category", "tatami", "deleted", "group", "system", "numcomp", "table", "wishsys", "pos1", "pos2", "pos3", "pos4", "pos5", "pos6", "pos7", "pos8", "color")
+    VALUES (:index, :category, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, '');
+"""
+
+COMPETITOR_COLUMNS = [
+    "index", "last", "first", "birthyear", "belt", "club", "regcategory",
+    "weight", "visible", "category", "deleted", "country", "id", "seeding",
+    "clubseeding", "comment", "coachid",
+]
+
+INSERT_COMPETITOR = """
+    INSERT INTO "main"."competitors" ({COLUMNS})
+    VALUES ({PARAMS});
+""".format(
+    COLUMNS=", ".join([f'"{c}"' for c in COMPETITOR_COLUMNS]),
+    PARAMS=", ".join([f":{c}" for c in COMPETITOR_COLUMNS]),
+)
+
+ALL_COMPETITORS = """
+    SELECT {COLUMNS}
+    FROM "main"."competitors"
+    ORDER BY "index" ;
+""".format(COLUMNS=", ".join([f'"{c}"' for c in COMPETITOR_COLUMNS]))
+
+
+def update_competitor_cmd(columns):
+    # only overwrite the given columns (e.g. keep seeding, belt, ...)
+    cmd = """
+    UPDATE "main"."competitors"
+    SET {ASSIGNMENTS}
+    WHERE "index" == :index ;
+    """.format(
+        ASSIGNMENTS=", ".join([f'"{c}" = :{c}' for c in columns if c != "index"]),
+    )
+    return cmd
+
+
+UPDATE_COMPETITOR = update_competitor_cmd(COMPETITOR_COLUMNS)
+
+# `deleted` holds several flags, bit 0 marks a deleted competitor
+SOFT_DELETE_COMPETITOR = """
+    UPDATE "main"."competitors"
+    SET "deleted" = ("deleted" | 1)
+    WHERE "index" == :index ;
+"""
+
+# move a competitor into another category
+UPDATE_COMPETITOR_CATEGORY = update_competitor_cmd(["category"])
+
+MAX_CATEGORY_INDEX = """
+    SELECT MAX("index")
+    FROM "main"."categories" ;
+"""
+
+SOFT_DELETE_CATEGORY = """
+    UPDATE "main"."categories"
+    SET "deleted" = ("deleted" | 1)
+    WHERE "index" == :index ;
+"""
+
+CATEGORIES = """
+    SELECT "index", category, numcomp, pos1, pos2, pos3, pos4
+    FROM "main"."categories"
+    WHERE deleted == 0 ;
+"""
+
+# summary of all categories in one row, changes if any category is
+# added/removed/renamed or its numcomp/pos changes (one entry per category,
+# so changes of different categories cannot cancel each other out)
+CATEGORY_INFO = """
+    SELECT category, numcomp, pos1, pos2, pos3, pos4
+    FROM "main"."categories"
+    WHERE "index" == :cid ;
+"""
+
+MATCH_INFO = """
+    SELECT blue, white, blue_points, white_points
+    FROM "main"."matches"
+    WHERE "category" == :cid AND "number" == :mid ;
+"""
+
+COMPETITORS_OF_CATEGORY = """
+    SELECT last, first, club, birthyear, country, category, "index", weight
+    FROM "main"."competitors"
+    WHERE "category" == :category ;
+"""
+
+
+def competitors_of_categories_cmd(n_categories):
+    # competitors of several categories in one query, params :category0, :category1, ...
+    cmd = """
+    SELECT last, first, club, birthyear, country, category, "index", weight
+    FROM "main"."competitors"
+    WHERE "category" IN ({PARAMS}) ;
+    """.format(
+        PARAMS=", ".join([f":category{i}" for i in range(n_categories)]),
+    )
+    return cmd
+
+
+COMPETITOR_INFO = """
+    SELECT last, first, club, birthyear, country
+    FROM "main"."competitors"
+    WHERE "index" == :cid ;
+"""
+
+MATCHES = """
+    SELECT category, number, blue_points, white_points
+    FROM "main"."matches"
+    WHERE category == :cid ;
+"""
+
+# category row + all matches (LEFT JOIN keeps categories without matches)
+CATEGORY_BUNDLE_MATCHES = """
+    SELECT c.category, c.numcomp, c.pos1, c.pos2, c.pos3, c.pos4,
+           m.category, m.number, m.blue, m.white, m.blue_points, m.white_points
+    FROM "main"."categories" AS c
+    LEFT JOIN "main"."matches" AS m ON m.category == c."index"
+    WHERE c."index" == :cid ;
+"""
+
+# all competitors referenced by the matches of a category
+CATEGORY_BUNDLE_COMPETITORS = """
+    SELECT "index", last, first, club, birthyear, country
+    FROM "main"."competitors"
+    WHERE "index" IN (
+        SELECT blue FROM "main"."matches" WHERE category == :cid
+        UNION
+        SELECT white FROM "main"."matches" WHERE category == :cid
+    ) ;
+"""
+
+
+# string literals / quoted identifiers are skipped, only :name is replaced
+_token_pattern = re.compile(r"""('(?:[^']|'')*')|("(?:[^"]|"")*")|:(\w+)""")
+
+
+def sql_literal(value):
+    # render a python value as SQLite literal
+    if value is None:
+        return "NULL"
+    elif isinstance(value, bool):
+        return str(int(value))
+    elif isinstance(value, int):
+        return str(value)
+    elif isinstance(value, float):
+        if not math.isfinite(value):
+            raise ValueError(f"Cannot bind non-finite float {value}")
+        return repr(value)
+    elif isinstance(value, str):
+        return "'" + value.replace("'", "''") + "'"
+    else:
+        raise TypeError(f"Cannot bind value of type {type(value).__name__}")
+
+
+def bind_literals(cmd, params):
+    # replace every :name in cmd with the quoted value of params[name]
+    def replace(match):
+        if match.group(3) is None:
+            return match.group(0)
+        return sql_literal(params[match.group(3)])
+
+    return _token_pattern.sub(replace, cmd)
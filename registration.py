@@ -0,0 +1,97 @@
+import csv
+import os
+
+import pandas
+
+# sheet of the registration workbook that holds the competitors
+SHEET_NAME = "Meldungen mit DS"
+
+
+def iter_rows(path, sheet_name=SHEET_NAME):
+    # yield one dict per registration row, without loading the whole file
+    ext = os.path.splitext(path)[1].lower()
+
+    if ext == ".csv":
+        yield from _iter_csv(path)
+    elif ext == ".parquet":
+        yield from _iter_parquet(path)
+    elif ext in [".xlsx", ".xlsm"]:
+        yield from _iter_xlsx(path, sheet_name)
+    else:
+        # e.g. ods -> no streaming reader available, let pandas do the work
+        df = pandas.read_excel(path, sheet_name=sheet_name)
+        df = df.astype(object).where(df.notna(), None)
+        yield from df.to_dict("records")
+
+
+def iter_chunks(path, sheet_name=SHEET_NAME, chunksize=1000, str_columns=("WeightCat",)):
+    # group rows into DataFrames of `chunksize` rows, the index continues
+    # over all chunks (as if the whole sheet was read at once)
+    rows = []
+    offset = 0
+
+    for row in iter_rows(path, sheet_name):
+        # per cell, before pandas infers a (float) dtype for the whole column
+        for column in str_columns:
+            if column in row:
+                row[column] = _cell_to_str(row[column])
+        rows.append(row)
+        if len(rows) == chunksize:
+            yield _to_frame(rows, offset, str_columns)
+            offset += len(rows)
+            rows = []
+
+    if rows:
+        yield _to_frame(rows, offset, str_columns)
+
+
+def _cell_to_str(value):
+    # same as read_excel(..., dtype=str): 57 -> "57" (also if stored as 57.0)
+    if value is None or (isinstance(value, float) and pandas.isna(value)):
+        return None
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return str(value)
+
+
+def _to_frame(rows, offset, str_columns):
+    df = pandas.DataFrame(rows, index=pandas.RangeIndex(offset, offset + len(rows)))
+
+    # explicit object dtype, blank cells stay None (no str/float inference)
+    for column in str_columns:
+        if column in df.columns:
+            df[column] = pandas.Series([row.get(column) for row in rows], index=df.index, dtype=object)
+
+    return df
+
+
+def _iter_xlsx(path, sheet_name):
+    import openpyxl
+
+    wb = openpyxl.load_workbook(path, read_only=True, data_only=True)
+    try:
+        rows = wb[sheet_name].iter_rows(values_only=True)
+        header = next(rows, None)
+        if header is None:
+            return
+
+        for values in rows:
+            yield dict(zip(header, values))
+    finally:
+        wb.close()
+
+
+def _iter_csv(path):
+    with open(path, "r", encoding="utf-8-sig", newline="") as f:
+        for row in csv.DictReader(f):
+            # empty cells -> missing values (as in the workbook)
+            yield {k: (v if v != "" else None) for k, v in row.items()}
+
+
+def _iter_parquet(path):
+    import pyarrow.parquet
+
+    parquet_file = pyarrow.parquet.ParquetFile(path)
+    for batch in parquet_file.iter_batches():
+        yield from batch.to_pylist()
+
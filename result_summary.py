@@ -1,11 +1,12 @@
 import argparse
-import copy
 import json
 import re
 import os
 
 import pandas
 
+from templating import SVGTemplate
+
 
 class ResultUtils:
 
@@ -145,19 +146,18 @@ class ResultUtils:
     def generate_certificates(self, winners, template_path, cat_name):
         print(template_path)
         
-        with open(template_path, "r") as f:
-            template = f.read()
+        template = SVGTemplate.from_file(
+            template_path, ["@@GENDER_CAT@@", "@@CLUB@@", "@@PLACE@@"]
+        )
         
         for place, clubs_and_points in winners.items():
 
             for club, points in clubs_and_points:
                 print(place, club, points)
 
-                output_svg = copy.copy(template)
-
-                output_svg = output_svg.replace("@@GENDER_CAT@@", cat_name)
-                output_svg = output_svg.replace("@@CLUB@@", club)
-                output_svg = output_svg.replace("@@PLACE@@", str(place))
+                output_svg = template.render(
+                    {"@@GENDER_CAT@@": cat_name, "@@CLUB@@": club, "@@PLACE@@": place}
+                )
 
                 save_clubname = "".join(x for x in club if x.isalnum())
                 
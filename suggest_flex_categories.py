@@ -1,26 +1,54 @@
 import argparse
+import concurrent.futures
 import json
 import os
 import re
 import subprocess
 import shlex
 
-import pandas
 import numpy as np
-import matplotlib.pyplot as plt
 
-from dbutils import JudoShiaiConnector_WEB
+from dbutils import JudoShiaiConnector_SQLITE, JudoShiaiConnector_WEB
+from flex_rules import FlexRules
+from flex_solver import FlexSolver
 
 
 class FlexWeightUtils:
-    def __init__(self, category, hostname):
+    def __init__(self, category, hostname=None, rules=None, db_path=None):
         self.category_pattern = re.compile("^(.*?) ([\+\-\d]*)kg$")
         self.category = category
-        self.jsc = JudoShiaiConnector_WEB(host=hostname)
+        self.rules = FlexRules() if rules is None else rules
+
+        # no connection needed if competitors are passed in (e.g. batch mode)
+        self.jsc = connect(hostname, db_path) if hostname or db_path else None
 
     def load_competitors(self):
+        # [last, first, club, birthyear, country, category, index, weight]
         competitors = self.jsc.get_competitors_of_category(self.category)
-        return competitors
+        return [list(c) for c in competitors]
+
+    def group_names(self, n_groups):
+        # "u12m ?" -> "u12m G01", "u12m G02", ...
+        label_prefix = self.category.replace("?", "G")
+        return [f"{label_prefix}{icat + 1:02d}" for icat in range(n_groups)]
+
+    def plan_category_changes(self, competitors_sorted, group_ranges, first_index):
+        # new categories + competitor moves for one solution, and the moves
+        # that restore the current state
+        group_names = self.group_names(len(group_ranges))
+
+        changes = {"new_categories": [], "assignments": [], "undo_assignments": []}
+        for icat, (start, end) in enumerate(group_ranges):
+            changes["new_categories"].append((group_names[icat], first_index + icat))
+
+            for c in competitors_sorted[start:end]:
+                if c[-2] is None:
+                    print(f"{c[0]}, {c[1]} is not in the database, assign to {group_names[icat]} by hand")
+                    continue
+                changes["assignments"].append({"index": c[-2], "category": group_names[icat]})
+                changes["undo_assignments"].append({"index": c[-2], "category": c[5]})
+
+        return changes
 
     def _modify_weight_for_testing(self, competitors):
         N = len(competitors)
@@ -38,91 +66,82 @@ class FlexWeightUtils:
 
         return competitors_modified
 
-    def potential_class_sizes(self, class_path, both_can_compete):
-        length_sizes = sum(class_path)
-
-        if length_sizes < len(both_can_compete):
-            max_from_here = np.sum(both_can_compete[length_sizes, length_sizes:])
-            valid_sizes = list(range(1, int(max_from_here) + 1))
-        else:
-            valid_sizes = []
-        return valid_sizes
-
-    def propose_weight_categories(self, competitors):
-        N = len(competitors)
-        data = [int(c[-1]) for c in competitors]
-        data_sorted = np.sort(data)
-
-        # who is allowed to compete with whom?
-        A_can_compete_with_B = np.ndarray((N, N))
-        for i, weight in enumerate(data_sorted):
-            w_low = 0.9 * weight
-            w_high = 1.1 * weight
-
-            A_can_compete_with_B[i, :] = np.logical_and(
-                w_low <= data_sorted, data_sorted <= w_high
+    def solve_partition(self, weights_sorted, top_k=10):
+        # groups as index ranges into `weights_sorted`
+        solver = FlexSolver.from_weights(weights_sorted, rules=self.rules, top_k=top_k)
+        solutions = [
+            (class_path, cost, solver.ranges(class_path))
+            for class_path, cost in solver.solutions()
+        ]
+        return solutions, solver.band()
+
+    def propose_weight_categories(self, competitors, top_k=10):
+        # weights are parsed and sorted once, all results refer to positions
+        # in `competitors_sorted` / `data_sorted`
+        data = np.array([int(c[-1]) for c in competitors], dtype=np.int64)
+        order = np.argsort(data, kind="stable")
+        competitors_sorted = [competitors[i] for i in order]
+        data_sorted = data[order]
+
+        # optimal partition (+ next best alternatives) under the given rules
+        solutions, both_can_compete = self.solve_partition(data_sorted, top_k=top_k)
+        if not solutions:
+            raise ValueError(
+                f"No valid partition of {len(data)} competitors for rules {self.rules.as_dict()}"
             )
 
-        B_can_compete_with_A = A_can_compete_with_B.T
-        both_can_compete = np.logical_and(A_can_compete_with_B, B_can_compete_with_A)
-
-        # try out a lot of combinations / "smart bruteforce" ;-)
-        class_paths = [[]]
-        class_path_status = [True]
-
-        for depth in range(12):
-            print(f"Iteration: {depth}")
-
-            new_class_paths = []
-            new_class_path_status = []
-
-            for class_path, status in zip(class_paths, class_path_status):
-                if status:
-                    valid_sizes = self.potential_class_sizes(
-                        class_path, both_can_compete
-                    )
+        suitable_results = []
+        for class_path, cost, group_ranges in solutions:
+            number_of_ones = sum([1 for l in class_path if l == 1])
+            suitable_results.append(
+                (class_path, number_of_ones, len(class_path), cost, group_ranges)
+            )
 
-                    # only use 3 biggest sizes if many are possible
-                    if len(valid_sizes) > 3:
-                        valid_sizes = valid_sizes[-3:]
+        return suitable_results, both_can_compete, competitors_sorted, data_sorted
 
-                    # only include class size 1, if no other option available
-                    elif len(valid_sizes) > 1:
-                        valid_sizes = valid_sizes[1:]
+    def plot_overview(self, data_sorted, group_ranges, both_can_compete, plot_filename):
+        # matplotlib is only needed (and imported) if a plot is requested
+        import matplotlib
 
-                    # create new class paths
-                    for vs in valid_sizes:
-                        new_class_path = class_path + [vs]
-                        new_class_paths.append(new_class_path)
-                        if sum(new_class_path) == N:
-                            new_class_path_status.append(False)
-                        else:
-                            new_class_path_status.append(True)
+        matplotlib.use("Agg")
+        import matplotlib.pyplot as plt
 
-                else:
-                    new_class_paths.append(class_path)
-                    new_class_path_status.append(False)
+        N = len(data_sorted)
+        rows = np.arange(N)
+        lo = both_can_compete[:, 0]
+        hi = both_can_compete[:, 1] - 1
 
-            # overwrite old information
-            class_paths = new_class_paths
-            class_path_status = new_class_path_status
+        # plot some information about the weight distribution
+        fig, ax = plt.subplots(2, 1, sharex=True)
+        ax[0].hist(data_sorted, bins=20)
+        #ax[0].set_xlabel("weight in [kg]")
+        ax[0].set_ylabel("competitors")
 
-        print("\n\n", len(class_paths))
-        suitable_results = []
-        for class_path, status in zip(class_paths, class_path_status):
-            if not status:
-                number_of_ones = sum([l for l in class_path if l == 1])
-                suitable_results.append(
-                    (class_path, number_of_ones, len(class_path), np.std(class_path))
-                )
+        # compatible partners of every competitor (one segment per row)
+        ax[1].hlines(rows, data_sorted[lo], data_sorted[hi], colors="lightgrey", linewidth=2)
+
+        # suggested groups on top
+        group_starts, group_ends = np.asarray(group_ranges).T
+        group_of_row = np.repeat(np.arange(len(group_ranges)), group_ends - group_starts)
+        ax[1].hlines(
+            rows,
+            data_sorted[group_starts[group_of_row]],
+            data_sorted[group_ends[group_of_row] - 1],
+            colors="black",
+            linewidth=2,
+        )
+        ax[1].plot(data_sorted, rows, "|", color="black")
 
-        suitable_results = sorted(suitable_results, key=lambda x: x[3])
+        # ax.set_aspect("equal")
+        ax[1].set_xlabel("weight in [kg]")
+        ax[1].set_ylabel("competitors")
 
-        return suitable_results, both_can_compete, data
+        fig.savefig(plot_filename, bbox_inches="tight", dpi=300)
+        plt.close(fig)
 
-    def create_overview(self, competitors, suitable_results, both_can_compete, data):
-        data_sorted = np.sort(data) / 1000
-        N = len(data)
+    def create_overview(self, competitors_sorted, suitable_results, both_can_compete, data_sorted, plot=True):
+        # competitors_sorted / data_sorted as returned by `propose_weight_categories`
+        data_sorted = np.asarray(data_sorted) / 1000
 
         # suitable results
         for res in suitable_results[:10]:
@@ -130,56 +149,25 @@ class FlexWeightUtils:
 
         # label prefix        
         cat_name_all = self.category.replace('?', '').strip()
-        label_prefix = self.category.replace("?", "G")
 
         # who belongs to which class? --> visualize one ("best") solution
-        competitors_sorted = sorted(competitors, key=lambda x: x[-1])
-        best_solution = suitable_results[0][0]  # "best" not best
-        best_solution_visualization = both_can_compete * 1.0
+        group_ranges = suitable_results[0][4]  # "best" not best
+        group_names = self.group_names(len(group_ranges))
         cat_descriptions = {}
-        i = 0
-        for icat, cat in enumerate(best_solution):
-            best_solution_visualization[i : i + cat, i : i + cat] = 2
-            lower_limit = data_sorted[i]
-            upper_limit = data_sorted[i + cat - 1]
-            cat_text = f"Gruppe {label_prefix}{icat + 1:02d} ({lower_limit:0.2f} - {upper_limit:0.2f} kg)"
+        for icat, (start, end) in enumerate(group_ranges):
+            lower_limit = data_sorted[start]
+            upper_limit = data_sorted[end - 1]
+            cat_text = f"Gruppe {group_names[icat]} ({lower_limit:0.2f} - {upper_limit:0.2f} kg)"
             competitor_texts = []
 
-            competitors_in_group = [
-                c
-                for c in competitors_sorted
-                if lower_limit <= float(c[-1]) / 1000
-                and float(c[-1]) / 1000 <= upper_limit
-            ]
-            for cig in competitors_in_group:
-                competitor_text = f"{cig[0]}, {cig[1]}, {cig[2]}, {float(cig[-1])/1000:0.2f}kg"
+            for cig, weight in zip(competitors_sorted[start:end], data_sorted[start:end]):
+                competitor_text = f"{cig[0]}, {cig[1]}, {cig[2]}, {weight:0.2f}kg"
                 competitor_texts.append(competitor_text)
             cat_descriptions[cat_text] = competitor_texts # sorted(competitor_texts)
-            i += cat
-
-        # plot some information about the weight distribution
-        X_weight, Y_count = np.meshgrid(data_sorted, np.arange(N), indexing="ij")
-
-        fig, ax = plt.subplots(2, 1, sharex=True)
-        ax[0].hist(data_sorted, bins=20)
-        #ax[0].set_xlabel("weight in [kg]")
-        ax[0].set_ylabel("competitors")
-
-        ax[1].pcolormesh(
-            X_weight,
-            Y_count,
-            best_solution_visualization,
-            edgecolors="white",
-            linewidth=0.1,
-            cmap="Greys",
-        )
-
-        # ax.set_aspect("equal")
-        ax[1].set_xlabel("weight in [kg]")
-        ax[1].set_ylabel("competitors")
 
         plot_filename = f"suggested_flex_cat_{cat_name_all}.png"
-        fig.savefig(plot_filename, bbox_inches="tight", dpi=300)
+        if plot:
+            self.plot_overview(data_sorted, group_ranges, both_can_compete, plot_filename)
 
         # turn into markdown file
         output_path = f"suggested_flex_cat_{cat_name_all}.md"
@@ -204,10 +192,11 @@ header-includes:
                 f.write(f"- {ct}\n")
             f.write("\n")
         
-        f.write("\pagebreak\n")
-        f.write("## Verteilung\n\n")
-        f.write(f"![image]({plot_filename})\n")
-        f.write("Gewichtsverteilung sowie Klasseneinteilung über Gewicht\n")
+        if plot:
+            f.write("\pagebreak\n")
+            f.write("## Verteilung\n\n")
+            f.write(f"![image]({plot_filename})\n")
+            f.write("Gewichtsverteilung sowie Klasseneinteilung über Gewicht\n")
         
         f.close()
 
@@ -216,6 +205,248 @@ header-includes:
         p = subprocess.Popen(cmd_args)
         p.wait()
 
+
+def interactive(fwu, competitors, top_k):
+    # what-if session at the weigh-in table, returns the modified competitors
+    competitors = {nr: list(c) for nr, c in enumerate(competitors)}
+    solver = FlexSolver.from_weights(
+        [int(c[-1]) for c in competitors.values()],
+        keys=list(competitors.keys()),
+        rules=fwu.rules,
+        top_k=top_k,
+    )
+
+    commands = (
+        "commands: ls | w <nr> <kg> (new weight) | rm <nr> (withdrawn) | "
+        "add <kg> <last> [<first>] (late entry) | q (done)"
+    )
+    print(commands)
+
+    show = True
+    while True:
+        if show:
+            solutions = solver.solutions()
+            if not solutions:
+                print(f"No valid partition for rules {fwu.rules.as_dict()}")
+            else:
+                class_path, cost = solutions[0]
+                print(f"\n{len(solver)} competitors -> {class_path}, cost {cost:0.2f}")
+                for icat, group in enumerate(solver.groups(class_path)):
+                    print(f"  {icat + 1:02d}:")
+                    for nr in group:
+                        c = competitors[nr]
+                        print(f"    [{nr}] {c[0]}, {c[1]}, {c[2]}, {int(c[-1])/1000:0.2f}kg")
+
+        try:
+            cmd = input("> ").split()
+        except EOFError:
+            break
+
+        show = True
+        try:
+            if not cmd:
+                show = False
+            elif cmd[0] == "q":
+                break
+            elif cmd[0] == "ls":
+                pass
+            elif cmd[0] == "w":
+                nr, weight = int(cmd[1]), int(float(cmd[2]) * 1000)
+                competitors[nr][-1] = str(weight)
+                solver.update_weight(nr, weight)
+            elif cmd[0] == "rm":
+                nr = int(cmd[1])
+                solver.remove_competitor(nr)
+                del competitors[nr]
+            elif cmd[0] == "add":
+                nr = max(competitors.keys(), default=-1) + 1
+                weight = int(float(cmd[1]) * 1000)
+                first = cmd[3] if len(cmd) > 3 else ""
+                competitors[nr] = [cmd[2], first, "", "", "", fwu.category, None, str(weight)]
+                solver.add_competitor(nr, weight)
+            else:
+                print(commands)
+                show = False
+        except (IndexError, KeyError, ValueError):
+            print(commands)
+            show = False
+
+    return list(competitors.values())
+
+
+def connect(host, db_path=None):
+    # offline (directly on the .shi file) or online (running JudoShiai)
+    if db_path:
+        return JudoShiaiConnector_SQLITE(db_path)
+    return JudoShiaiConnector_WEB(host=host)
+
+
+def merge_category_changes(changes_list):
+    merged = {"new_categories": [], "assignments": [], "undo_assignments": []}
+    for changes in changes_list:
+        for key in merged:
+            merged[key].extend(changes[key])
+    return merged
+
+
+def apply_category_changes(jsc, changes, undo_path, dry_run=False):
+    # create all suggested categories and move all competitors at once
+    for cat_name, ix in changes["new_categories"]:
+        print(f"create category [{ix}] {cat_name}")
+    for assignment, undo in zip(changes["assignments"], changes["undo_assignments"]):
+        print(f"move competitor [{assignment['index']}] {undo['category']} -> {assignment['category']}")
+
+    if dry_run:
+        print("dry run, nothing written")
+        return
+
+    # written first -> a rollback is possible whatever happens afterwards
+    undo = {
+        "new_categories": changes["new_categories"],
+        "assignments": changes["undo_assignments"],
+    }
+    with open(undo_path, "w", encoding="UTF-8") as f:
+        json.dump(undo, f, indent=2, ensure_ascii=False)
+
+    jsc.apply_category_changes(
+        new_categories=changes["new_categories"], assignments=changes["assignments"]
+    )
+    print(f"applied, undo with: --rollback {undo_path}")
+
+
+def rollback_category_changes(jsc, undo_path, dry_run=False):
+    # move competitors back and delete the categories created by `apply_category_changes`
+    with open(undo_path, "r", encoding="UTF-8") as f:
+        undo = json.load(f)
+
+    for cat_name, ix in undo["new_categories"]:
+        print(f"delete category [{ix}] {cat_name}")
+    for assignment in undo["assignments"]:
+        print(f"move competitor [{assignment['index']}] -> {assignment['category']}")
+
+    if dry_run:
+        print("dry run, nothing written")
+        return
+
+    jsc.apply_category_changes(
+        assignments=undo["assignments"],
+        deleted_categories=[ix for _, ix in undo["new_categories"]],
+    )
+    print("rolled back")
+
+
+def find_flex_pools(jsc):
+    # flex pools are the categories with a "?" instead of a weight, e.g. "u12m ?"
+    return [cat[1] for cat in jsc.get_categories() if "?" in cat[1]]
+
+
+def pool_rules(category, rules_path, rule_options):
+    # rules file (if any) + command line, resolved per pool
+    if rules_path:
+        return FlexRules.from_file(rules_path, category, **rule_options)
+    return FlexRules(**{k: v for k, v in rule_options.items() if v is not None})
+
+
+def solve_pool(category, competitors, rules, top_k):
+    # runs in a worker process
+    fwu = FlexWeightUtils(category, rules=rules)
+    return fwu.propose_weight_categories(competitors, top_k=top_k)
+
+
+def render_pool(category, competitors_sorted, res, bcc, data_sorted, plot=True):
+    # runs in a worker process (plot + pandoc)
+    fwu = FlexWeightUtils(category)
+    fwu.create_overview(competitors_sorted, res, bcc, data_sorted, plot=plot)
+
+
+def run_batch(
+    host,
+    rules_path,
+    rule_options,
+    top_k,
+    jobs,
+    replace_weights=False,
+    plot=True,
+    db_path=None,
+    apply=False,
+    dry_run=False,
+):
+    # discover all flex pools, load their competitors in one query, solve the
+    # pools in parallel and render each overview as soon as its pool is solved
+    with connect(host, db_path) as jsc:
+        categories = find_flex_pools(jsc)
+        competitors = jsc.get_competitors_of_categories(categories)
+
+    if replace_weights:
+        # used only for testing :-)
+        fwu = FlexWeightUtils(None)
+        competitors = {cat: fwu._modify_weight_for_testing(c) for cat, c in competitors.items()}
+
+    summary = {}
+    solved = {}  # category -> (competitors_sorted, group ranges of the best solution)
+    with concurrent.futures.ProcessPoolExecutor(max_workers=jobs) as pool:
+        solve_futures = {}
+        for category in categories:
+            if not competitors[category]:
+                summary[category] = "no competitors"
+                continue
+            rules = pool_rules(category, rules_path, rule_options)
+            future = pool.submit(solve_pool, category, competitors[category], rules, top_k)
+            solve_futures[future] = category
+
+        render_futures = {}
+        for future in concurrent.futures.as_completed(solve_futures):
+            category = solve_futures[future]
+            try:
+                res, bcc, competitors_sorted, data_sorted = future.result()
+            except ValueError as e:
+                summary[category] = f"failed ({e})"
+                continue
+
+            class_path, number_of_ones, n_groups, cost, group_ranges = res[0]
+            solved[category] = (competitors_sorted, group_ranges)
+            summary[category] = (
+                f"{len(data_sorted)} competitors -> {n_groups} groups {class_path}, "
+                f"{number_of_ones} single, cost {cost:0.2f}"
+            )
+            print(f"solved {category}: {summary[category]}")
+
+            render_future = pool.submit(
+                render_pool, category, competitors_sorted, res, bcc, data_sorted, plot
+            )
+            render_futures[render_future] = category
+
+        for future in concurrent.futures.as_completed(render_futures):
+            category = render_futures[future]
+            try:
+                future.result()
+            except Exception as e:
+                summary[category] += f", overview failed ({e})"
+
+    print("\n\nSummary")
+    for category in categories:
+        print(f"- {category}: {summary[category]}")
+
+    if apply or dry_run:
+        # all pools in one transaction
+        with connect(host, db_path) as jsc:
+            next_index = jsc.get_next_category_index()
+            changes_list = []
+            for category in categories:
+                if category not in solved:
+                    continue
+                fwu = FlexWeightUtils(category)
+                competitors_sorted, group_ranges = solved[category]
+                changes = fwu.plan_category_changes(competitors_sorted, group_ranges, next_index)
+                next_index += len(changes["new_categories"])
+                changes_list.append(changes)
+
+            changes = merge_category_changes(changes_list)
+            apply_category_changes(jsc, changes, "suggested_flex_cats.undo.json", dry_run=dry_run)
+
+    return summary
+
+
 if __name__ == "__main__":
     # argparse interface
     parser = argparse.ArgumentParser(
@@ -225,15 +456,140 @@ if __name__ == "__main__":
 
     parser.add_argument(
         "category",
+        nargs="?",
+        default=None,
         help="Category that holds all the competitors",
     )
 
+    parser.add_argument(
+        "--all",
+        action="store_true",
+        help="process all flex pools (categories containing '?') in parallel",
+    )
+
+    parser.add_argument(
+        "-j",
+        "--jobs",
+        type=int,
+        default=os.cpu_count(),
+        help="number of worker processes in --all mode",
+    )
+
     parser.add_argument(
         "--host",
         default="localhost",
         help="URL/IP for host that runs JudoShiai",
     )
 
+    parser.add_argument(
+        "--top-k",
+        type=int,
+        default=10,
+        help="number of alternative solutions to compute",
+    )
+
+    parser.add_argument(
+        "--rules",
+        default=None,
+        help="JSON file with rules (for all categories or per category prefix)",
+    )
+
+    parser.add_argument(
+        "--max-weight-ratio",
+        type=float,
+        default=None,
+        help="heaviest competitor of a group may weigh at most RATIO x lightest (default 1.1)",
+    )
+
+    parser.add_argument(
+        "--max-gap-kg",
+        type=float,
+        default=None,
+        help="maximum weight difference within a group in kg",
+    )
+
+    parser.add_argument(
+        "--min-group-size",
+        type=int,
+        default=None,
+        help="lower limit for the number of competitors per group",
+    )
+
+    parser.add_argument(
+        "--max-group-size",
+        type=int,
+        default=None,
+        help="upper limit for the number of competitors per group",
+    )
+
+    parser.add_argument(
+        "--preferred-size",
+        type=int,
+        nargs=2,
+        default=None,
+        metavar=("MIN", "MAX"),
+        help="preferred number of competitors per group (default 4 5)",
+    )
+
+    parser.add_argument(
+        "--singleton-penalty",
+        type=float,
+        default=None,
+        help="additional cost for groups with a single competitor (default 10)",
+    )
+
+    parser.add_argument(
+        "--variance-penalty",
+        type=float,
+        default=None,
+        help="additional cost per kg^2 of weight variance within a group (default 0)",
+    )
+
+    parser.add_argument(
+        "--size-variance-penalty",
+        type=float,
+        default=None,
+        help="additional cost per unit of variance of the group sizes, favours evenly sized groups (default 0)",
+    )
+
+    parser.add_argument(
+        "--db",
+        default=None,
+        help="work directly on a .shi file instead of a running JudoShiai",
+    )
+
+    parser.add_argument(
+        "--apply",
+        action="store_true",
+        help="create the suggested categories and move the competitors (one transaction, needs --db)",
+    )
+
+    parser.add_argument(
+        "--dry-run",
+        action="store_true",
+        help="only print what --apply / --rollback would change",
+    )
+
+    parser.add_argument(
+        "--rollback",
+        default=None,
+        metavar="UNDO_FILE",
+        help="undo a previous --apply (file is written by --apply, needs --db)",
+    )
+
+    parser.add_argument(
+        "-i",
+        "--interactive",
+        action="store_true",
+        help="adjust weights / withdraw / add competitors and re-solve before writing the overview",
+    )
+
+    parser.add_argument(
+        "--no-plot",
+        action="store_true",
+        help="skip the weight distribution plot (no matplotlib needed)",
+    )
+
     parser.add_argument(
         "--replace_weights",
         action="store_true",
@@ -242,14 +598,68 @@ if __name__ == "__main__":
 
     args = parser.parse_args()
 
-    # analyse competitors
-    fwu = FlexWeightUtils(args.category, args.host)
+    if args.category is None and not args.all and not args.rollback:
+        parser.error("either a category, --all or --rollback is required")
 
-    c = fwu.load_competitors()
+    # writing through the web interface is not transactional (no error/rollback
+    # handling for the SQL reply) -> only offline on the .shi file
+    if (args.apply or args.rollback) and not args.dry_run and not args.db:
+        parser.error(
+            "--apply / --rollback only work offline: close JudoShiai and pass the tournament file via --db"
+        )
 
-    if args.replace_weights:
-        # used only for testing :-)
-        c = fwu._modify_weight_for_testing(c)
+    # rules: file (if any) + command line
+    rule_options = {
+        "max_weight_ratio": args.max_weight_ratio,
+        "max_gap_kg": args.max_gap_kg,
+        "min_group_size": args.min_group_size,
+        "max_group_size": args.max_group_size,
+        "preferred_size": args.preferred_size,
+        "singleton_penalty": args.singleton_penalty,
+        "variance_penalty": args.variance_penalty,
+        "size_variance_penalty": args.size_variance_penalty,
+    }
+
+    if args.rollback:
+        with connect(args.host, args.db) as jsc:
+            rollback_category_changes(jsc, args.rollback, dry_run=args.dry_run)
+
+    elif args.all:
+        run_batch(
+            args.host,
+            args.rules,
+            rule_options,
+            args.top_k,
+            args.jobs,
+            replace_weights=args.replace_weights,
+            plot=not args.no_plot,
+            db_path=args.db,
+            apply=args.apply,
+            dry_run=args.dry_run,
+        )
+
+    else:
+        # analyse competitors
+        rules = pool_rules(args.category, args.rules, rule_options)
+        fwu = FlexWeightUtils(args.category, args.host, rules, db_path=args.db)
+
+        c = fwu.load_competitors()
+
+        if args.replace_weights:
+            # used only for testing :-)
+            c = fwu._modify_weight_for_testing(c)
 
-    res, bcc, data = fwu.propose_weight_categories(c)
-    fwu.create_overview(c, res, bcc, data)
+        if args.interactive:
+            c = interactive(fwu, c, args.top_k)
+
+        res, bcc, c_sorted, data_sorted = fwu.propose_weight_categories(c, top_k=args.top_k)
+        fwu.create_overview(c_sorted, res, bcc, data_sorted, plot=not args.no_plot)
+
+        if args.apply or args.dry_run:
+            changes = fwu.plan_category_changes(
+                c_sorted, res[0][4], fwu.jsc.get_next_category_index()
+            )
+            cat_name_all = args.category.replace("?", "").strip()
+            apply_category_changes(
+                fwu.jsc, changes, f"suggested_flex_cat_{cat_name_all}.undo.json", dry_run=args.dry_run
+            )
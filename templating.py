@@ -0,0 +1,55 @@
+import re
+from xml.sax.saxutils import escape
+
+
+# placeholders may also end up inside of attributes -> escape quotes as well
+_xml_entities = {'"': "&quot;", "'": "&apos;"}
+
+
+class SVGTemplate:
+    # parse a template once into static chunks + slots, each document is
+    # then rendered with a single join instead of one str.replace per placeholder
+
+    def __init__(self, text, placeholders):
+        self.text = text
+        self.placeholders = list(placeholders)
+
+        # longest first, so that overlapping names are matched correctly
+        pattern = "|".join(
+            re.escape(p) for p in sorted(self.placeholders, key=len, reverse=True)
+        )
+
+        self.chunks = []  # static text, len(slots) + 1 entries
+        self.slots = []  # placeholder between chunk i and i+1
+        pos = 0
+        if self.placeholders:
+            for match in re.finditer(pattern, text):
+                self.chunks.append(text[pos : match.start()])
+                self.slots.append(match.group(0))
+                pos = match.end()
+        self.chunks.append(text[pos:])
+
+    @classmethod
+    def from_file(cls, path, placeholders):
+        with open(path, "r") as f:
+            text = f.read()
+        return cls(text, placeholders)
+
+    def render(self, values, xml_escape=True):
+        # values: dict placeholder -> replacement
+        if xml_escape:
+            values = {k: escape(str(v), _xml_entities) for k, v in values.items()}
+        else:
+            values = {k: str(v) for k, v in values.items()}
+
+        parts = [self.chunks[0]]
+        for slot, chunk in zip(self.slots, self.chunks[1:]):
+            parts.append(values[slot])
+            parts.append(chunk)
+
+        return "".join(parts)
+
+    def render_many(self, records, xml_escape=True):
+        # records: iterable of dicts, yields one document per record
+        for values in records:
+            yield self.render(values, xml_escape=xml_escape)
@@ -0,0 +1,172 @@
+import concurrent.futures
+import contextlib
+import hashlib
+import json
+import os
+import shlex
+import shutil
+import subprocess
+import tempfile
+
+
+# different ways to turn filled SVG tickets into one PDF per group
+RENDERERS = ["inkscape", "inkscape-shell", "cairosvg"]
+
+
+@contextlib.contextmanager
+def scratch_dir():
+    # RAM-backed if possible (slow SD-cards...), always removed afterwards
+    ram_dir = "/dev/shm"
+    base_dir = ram_dir if os.path.isdir(ram_dir) and os.access(ram_dir, os.W_OK) else None
+
+    with tempfile.TemporaryDirectory(prefix="shi_tickets_", dir=base_dir) as path:
+        yield path
+
+
+def run_with_retries(cmd_args, timeout, retries, input=None):
+    # returns exit code of last attempt (None if it timed out)
+    exit_code = None
+    for attempt in range(retries + 1):
+        try:
+            p = subprocess.run(cmd_args, timeout=timeout, input=input)
+            exit_code = p.returncode
+        except subprocess.TimeoutExpired:
+            exit_code = None
+
+        if exit_code == 0:
+            break
+
+    return exit_code
+
+
+def render_inkscape(documents, scratch, n_jobs, timeout, retries):
+    # one inkscape process per ticket, at most `n_jobs` at the same time
+    # the SVG is piped via stdin, only the PDF is written (into `scratch`)
+    # documents: list of (name, svg_text), returns (pdf_paths, failed names)
+    pdf_paths = []
+    failed_names = []
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=n_jobs) as pool:
+        futures = {}
+        for name, svg_text in documents:
+            pdf_path = os.path.join(scratch, f"{name}.pdf")
+            pdf_paths.append(pdf_path)
+            cmd_args = ["inkscape", "--pipe", "--export-area-page", "--export-type=pdf", f"--export-filename={pdf_path}"]
+            future = pool.submit(run_with_retries, cmd_args, timeout, retries, svg_text.encode("utf-8"))
+            futures[future] = (name, pdf_path)
+
+        for n_done, future in enumerate(concurrent.futures.as_completed(futures), start=1):
+            name, pdf_path = futures[future]
+            exit_code = future.result()
+            print(f"[{n_done}/{len(futures)}] {name}: exit code {exit_code}")
+            if exit_code != 0:
+                failed_names.append(name)
+                pdf_paths.remove(pdf_path)
+
+    return pdf_paths, failed_names
+
+
+def render_inkscape_shell(documents, scratch, timeout):
+    # a single inkscape process converts all tickets (`inkscape --shell`)
+    # documents: list of (name, svg_text), returns (pdf_paths, failed names)
+    jobs = []
+    for name, svg_text in documents:
+        svg_path = os.path.join(scratch, f"{name}.svg")
+        pdf_path = os.path.join(scratch, f"{name}.pdf")
+        with open(svg_path, "w") as svg_file:
+            svg_file.write(svg_text)
+        jobs.append((name, svg_path, pdf_path))
+
+    commands = []
+    for _, svg_path, pdf_path in jobs:
+        commands.append(
+            f"file-open:{svg_path}; export-area-page; export-filename:{pdf_path}; export-do; file-close"
+        )
+    commands.append("quit")
+
+    try:
+        subprocess.run(
+            ["inkscape", "--shell"],
+            input="\n".join(commands) + "\n",
+            text=True,
+            timeout=timeout * max(len(jobs), 1),
+        )
+    except subprocess.TimeoutExpired:
+        print("inkscape --shell did not finish in time")
+
+    pdf_paths = [pdf_path for _, _, pdf_path in jobs if os.path.exists(pdf_path)]
+    failed_names = [name for name, _, pdf_path in jobs if not os.path.exists(pdf_path)]
+    return pdf_paths, failed_names
+
+
+def render_cairosvg(documents, scratch):
+    # pure python: render every SVG document to PDF in memory, no external
+    # processes (combine with `merge_pdfs(..., use_gs=False)`)
+    # documents: list of (name, svg_text), returns (pdf_paths, failed names)
+    import cairosvg
+
+    pdf_paths = []
+    failed_names = []
+
+    for n_done, (name, svg_text) in enumerate(documents, start=1):
+        pdf_path = os.path.join(scratch, f"{name}.pdf")
+        try:
+            cairosvg.svg2pdf(bytestring=svg_text.encode("utf-8"), write_to=pdf_path)
+            pdf_paths.append(pdf_path)
+            status = "ok"
+        except Exception as e:
+            failed_names.append(name)
+            status = f"failed ({e})"
+        print(f"[{n_done}/{len(documents)}] {name}: {status}")
+
+    return pdf_paths, failed_names
+
+
+def merge_pdfs(pdf_paths, output_path, use_gs=True):
+    if not use_gs:
+        # combine in-process, without starting ghostscript
+        from pypdf import PdfWriter
+
+        writer = PdfWriter()
+        for pdf_path in pdf_paths:
+            writer.append(pdf_path)
+        with open(output_path, "wb") as f:
+            writer.write(f)
+        return
+
+    # combine single page PDFs using ghostscript
+    input_paths = " ".join([shlex.quote(p) for p in pdf_paths])
+    s = "gs -q -dNOPAUSE -dBATCH -sDEVICE=pdfwrite -sOutputFile={OUT} {IN}".format(OUT=shlex.quote(output_path), IN=input_paths)
+    cmd_args = shlex.split(s)
+
+    p = subprocess.Popen(cmd_args)
+    p.communicate()
+
+
+# rendered single page PDFs, keyed by template + renderer + ticket content
+class TicketCache:
+
+    def __init__(self, cache_dir, template_text, renderer):
+        self.cache_dir = cache_dir
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+        # a changed template (or renderer) invalidates all tickets
+        self.prefix = hashlib.sha256(
+            (renderer + "\0" + template_text).encode("utf-8")
+        ).hexdigest()
+
+    def key(self, values):
+        values_json = json.dumps(values, sort_keys=True, default=str, ensure_ascii=False)
+        return hashlib.sha256((self.prefix + values_json).encode("utf-8")).hexdigest()
+
+    def path(self, key):
+        return os.path.join(self.cache_dir, f"{key}.pdf")
+
+    def __contains__(self, key):
+        return os.path.exists(self.path(key))
+
+    def store(self, key, pdf_path):
+        # copy first, then rename -> no half-written pages in the cache
+        tmp_path = self.path(key) + ".part"
+        shutil.copyfile(pdf_path, tmp_path)
+        os.replace(tmp_path, self.path(key))